@@ -1,4 +1,9 @@
 #!/usr/bin/env bash
 set -e
 
+# Worker'ы пишут метрики в общий каталог, /metrics собирает их вместе.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 gunicorn main:app --bind 0.0.0.0:8000 -w ${WORKERS:-1} -k uvicorn.workers.UvicornWorker
@@ -0,0 +1,121 @@
+import secrets
+from http import HTTPStatus
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Security
+from fastapi.responses import FileResponse
+from fastapi.security import APIKeyHeader
+from pydantic import Field
+
+from core.settings import settings
+from db.search_engine.slow_log import slow_queries
+from models.base import OrjsonBaseModel
+from utils.cache import invalidate
+from utils.profiling import list_profiles, profile_path
+
+get_admin_token = APIKeyHeader(name='X-Admin-Token', auto_error=False)
+
+
+async def check_admin_token(token: str = Security(get_admin_token)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=HTTPStatus.FORBIDDEN,
+                            detail='admin api disabled')
+    if not token or not secrets.compare_digest(token, settings.admin_token):
+        raise HTTPException(status_code=HTTPStatus.FORBIDDEN,
+                            detail='invalid admin token')
+
+
+router = APIRouter(dependencies=[Depends(check_admin_token)])
+
+
+class CacheInvalidation(OrjsonBaseModel):
+    ids: list[UUID] = Field(title='id фильмов, персон и жанров',
+                            min_items=1)
+
+
+class CacheInvalidationResult(OrjsonBaseModel):
+    deleted: int = Field(title='Число удалённых записей кэша')
+
+
+@router.post(
+    '/cache/invalidate',
+    response_model=CacheInvalidationResult,
+    summary='Сброс кэша',
+    description='Сбрасывает записи кэша, в которых есть указанные id.',
+)
+async def cache_invalidate(
+    invalidation: CacheInvalidation
+) -> CacheInvalidationResult:
+    deleted = await invalidate(invalidation.ids)
+    return CacheInvalidationResult(deleted=deleted)
+
+
+class SlowQuery(OrjsonBaseModel):
+    fingerprint: str = Field(title='Отпечаток вида запроса')
+    operation: str = Field(title='Операция Elastic')
+    index: str = Field(title='Индекс')
+    query: str = Field(title='Запрос без значений')
+    count: int = Field(title='Число медленных запросов')
+    total_ms: float = Field(title='Суммарное время ответа, мс')
+    max_ms: float = Field(title='Наибольшее время ответа, мс')
+    total_took_ms: int = Field(title='Суммарный took, мс')
+    total_hits: int = Field(title='Суммарное число документов')
+    total_source_bytes: int = Field(title='Суммарный размер _source, байт')
+    callers: list[str] = Field(title='Методы сервисов, отправлявшие запрос')
+
+
+class SlowQueries(OrjsonBaseModel):
+    threshold_ms: float = Field(title='Порог медленного запроса, мс')
+    dropped: int = Field(title='Запросы, не учтённые из-за числа отпечатков')
+    queries: list[SlowQuery]
+
+
+@router.get(
+    '/slow-queries',
+    response_model=SlowQueries,
+    summary='Медленные запросы к Elastic',
+    description='Виды медленных запросов к Elastic с наибольшим суммарным '
+                'временем ответа. Статистика своя у каждого worker\'а.',
+)
+async def slow_queries_top(
+    limit: Annotated[int, Query(description='Число видов запросов',
+                                ge=1)] = 20
+) -> SlowQueries:
+    return SlowQueries(
+        threshold_ms=slow_queries.threshold_ms,
+        dropped=slow_queries.dropped,
+        queries=[SlowQuery(**{**vars(stats),
+                              'callers': sorted(stats.callers)})
+                 for stats in slow_queries.top(limit)],
+    )
+
+
+class Profile(OrjsonBaseModel):
+    name: str = Field(title='Имя профиля')
+    size: int = Field(title='Размер, байт')
+
+
+@router.get(
+    '/profiles',
+    response_model=list[Profile],
+    summary='Профили запросов',
+    description='Сохранённые профили запросов, от новых к старым.',
+)
+async def profiles() -> list[Profile]:
+    return [Profile(name=path.name, size=path.stat().st_size)
+            for path in list_profiles()]
+
+
+@router.get(
+    '/profiles/{name}',
+    response_class=FileResponse,
+    summary='Профиль запроса',
+    description='Профиль в формате folded для flamegraph.pl и speedscope.',
+)
+async def profile(name: str) -> FileResponse:
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail='profile not found')
+    return FileResponse(path, media_type='text/plain', filename=name)
@@ -0,0 +1,99 @@
+from typing import (Annotated, Any, Callable, Iterable, Literal, NamedTuple,
+                    Optional)
+from uuid import UUID
+
+from fastapi import Query, Response
+from fastapi.responses import ORJSONResponse
+
+from utils.cache import tag_response
+from utils.tracing import span
+
+
+def _same(value: Any) -> Any:
+    return value
+
+
+def to_uuid(value: UUID | str) -> UUID:
+    """UUID сериализуется orjson в каноническом виде, как из pydantic."""
+    return value if isinstance(value, UUID) else UUID(value)
+
+
+def to_float(value: Optional[float]) -> Optional[float]:
+    """Целый рейтинг из ES pydantic отдаёт как число с точкой."""
+    return None if value is None else float(value)
+
+
+class SourceField(NamedTuple):
+    """Поле ответа: поле документа ES и функция, строящая из него значение."""
+    source: str
+    build: Callable[[Any], Any] = _same
+
+
+class Fieldset:
+    """Поля модели ответа и то, как они строятся из документа ES.
+
+    Документы из _source переводятся в формат ответа заранее собранной
+    функцией и сериализуются orjson без моделей pydantic. Результат
+    совпадает с ответом через response_model байт в байт.
+
+    Клиент может выбрать поля параметром fields: по ним строится список
+    полей ES для _source и ответ только с этими полями. Поля ответа идут
+    в порядке модели, а не запроса, чтобы одинаковые наборы полей давали
+    одинаковые ответы и записи кэша.
+
+    Поля ES из required_source запрашиваются всегда, даже если их нет
+    в ответе: по id из документов помечается тегами запись кэша ответа.
+    """
+
+    def __init__(self, fields: dict[str, SourceField],
+                 required_source: tuple[str, ...] = ('id',)):
+        self.fields = fields
+        self.required_source = required_source
+        self.param = Annotated[
+            Optional[list[Literal[tuple(fields)]]],
+            Query(description='Поля ответа, по умолчанию все поля.'),
+        ]
+        self._mappers: dict[Optional[frozenset[str]], Callable] = {}
+
+    def source(self, names: Optional[list[str]]) -> Optional[list[str]]:
+        """Возвращает поля ES для выбранных полей или None для всех."""
+        if not names:
+            return None
+        return list(dict.fromkeys([
+            *self.required_source,
+            *(self.fields[name].source
+              for name in self.fields if name in names)]))
+
+    def mapper(self, names: Optional[Iterable[str]] = None
+               ) -> Callable[[dict], dict]:
+        """Возвращает функцию, строящую ответ из документа ES."""
+        key = frozenset(names) if names else None
+        mapper = self._mappers.get(key)
+        if mapper is None:
+            plan = [(name, field.source, field.build)
+                    for name, field in self.fields.items()
+                    if key is None or name in key]
+
+            def mapper(doc: dict) -> dict:
+                return {name: build(doc.get(source))
+                        for name, source, build in plan}
+
+            self._mappers[key] = mapper
+        return mapper
+
+    def response(self, docs: list[dict] | dict,
+                 names: Optional[list[str]], response: Response
+                 ) -> Response:
+        """Возвращает ответ из одного или списка документов ES.
+
+        Ответ отдаётся мимо response_model, поэтому заголовки, уже
+        выставленные обработчиком, переносятся в него.
+        """
+        with span('response.build'):
+            mapper = self.mapper(names)
+            if isinstance(docs, list):
+                content = [mapper(doc) for doc in docs]
+            else:
+                content = mapper(docs)
+            return tag_response(
+                ORJSONResponse(content, headers=response.headers), docs)
@@ -1,19 +1,23 @@
 import logging
 from http import HTTPStatus
-from typing import Annotated, Literal, Optional
+from typing import Annotated, Awaitable, Literal, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.security import HTTPBearer
-from fastapi_cache.decorator import cache
 from pydantic import Field
 
+from api.v1.fieldsets import Fieldset, SourceField, to_float, to_uuid
 from api.v1.genres import Genre
 from core.settings import settings
+from db.access_stats import record_access
+from db.search_engine.base import InvalidCursorError
 from models.base import OrjsonBaseModel
+from models.film import ESFilm
 from models.person import ROLES
 from services.auth import AuthService, get_auth_service
 from services.film import FilmService, get_film_service
+from utils.cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +25,16 @@ router = APIRouter()
 
 get_creds = HTTPBearer(auto_error=False)
 
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+# Фильмы с рейтингом не ниже этого доступны только подписчикам.
+SUBSCRIBER_RATING = 8.0
+CURSOR_DESCRIPTION = (
+    'Курсор страницы. Пустое значение включает пагинацию курсором и '
+    'возвращает первую страницу, курсор следующей страницы приходит '
+    f'в заголовке {NEXT_CURSOR_HEADER}. С курсором page_number не '
+    'учитывается.'
+)
+
 
 class Film(OrjsonBaseModel):
     uuid: UUID = Field(title='id фильма')
@@ -33,6 +47,20 @@ class FilmPerson(OrjsonBaseModel):
     full_name: str = Field(title='Имя')
 
 
+async def get_cursor_page(page: Awaitable[tuple[list, Optional[str]]],
+                          response: Response) -> list:
+    """Возвращает элементы страницы и передаёт курсор в заголовке ответа."""
+    try:
+        items, next_cursor = await page
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=str(e))
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
+
+
 class FilmFull(Film):
     description: str = Field(title='Описание')
     genre: list[Genre] = Field(title='Жанры')
@@ -41,13 +69,36 @@ class FilmFull(Film):
     directors: list[FilmPerson] = Field(title='Режиссёры')
 
 
+FILM_FIELDS = Fieldset({
+    'uuid': SourceField('id', to_uuid),
+    'title': SourceField('title'),
+    'imdb_rating': SourceField('imdb_rating', to_float),
+})
+FILM_FULL_FIELDS = Fieldset({
+    **FILM_FIELDS.fields,
+    'description': SourceField('description'),
+    'genre': SourceField('genres', lambda genres: [
+        {'uuid': to_uuid(genre['id']), 'name': genre['name']}
+        for genre in genres]),
+    **{
+        f'{role}s': SourceField(f'{role}s', lambda persons: [
+            {'uuid': to_uuid(person['id']), 'full_name': person['name']}
+            for person in persons])
+        for role in ROLES
+    },
+})
+
+
 @router.get(
     '',
     response_model=list[Film],
     summary='Список фильмов',
     description='Возвращает список фильмов с учётом фильтров и сортировки.',
+    dependencies=[Depends(record_access('film_list',
+                                        uncached_params=['cursor']))],
 )
-@cache(expire=settings.redis_cache_expire_seconds)
+@cache(expire=settings.redis_cache_expire_seconds, namespace='films',
+       uncached_params=['cursor'])
 async def film_list(
     genre: Annotated[Optional[UUID], Query(description='id жанра')] = None,
     sort: Annotated[
@@ -59,13 +110,21 @@ async def film_list(
                            Query(description='Номер страницы', ge=1)] = 1,
     page_size: Annotated[int,
                          Query(description='Размер страницы', ge=1)] = 50,
+    cursor: Annotated[Optional[str],
+                      Query(description=CURSOR_DESCRIPTION)] = None,
+    fields: FILM_FIELDS.param = None,
+    response: Response = None,
     film_service: FilmService = Depends(get_film_service)
-) -> list[Film]:
-    films = await film_service.list(genre, sort, page_number, page_size)
-    return [
-        Film(uuid=film.id, title=film.title, imdb_rating=film.imdb_rating)
-        for film in films
-    ]
+) -> Response:
+    source = FILM_FIELDS.source(fields)
+    if cursor is None:
+        films = await film_service.list(genre, sort, page_number, page_size,
+                                        source)
+    else:
+        films = await get_cursor_page(
+            film_service.list_page(genre, sort, cursor, page_size, source),
+            response)
+    return FILM_FIELDS.response(films, fields, response)
 
 
 @router.get(
@@ -74,20 +133,53 @@ async def film_list(
     summary='Поиск по фильмам',
     description='Возвращает список фильмов по поисковому запросу.',
 )
-@cache(expire=settings.redis_cache_expire_seconds)
+@cache(expire=settings.redis_cache_expire_seconds, namespace='films',
+       uncached_params=['cursor'])
 async def film_search(
     query: Annotated[str, Query(description='Поисковый запрос')],
     page_number: Annotated[int,
                            Query(description='Номер страницы', ge=1)] = 1,
     page_size: Annotated[int,
                          Query(description='Размер страницы', ge=1)] = 50,
+    cursor: Annotated[Optional[str],
+                      Query(description=CURSOR_DESCRIPTION)] = None,
+    fields: FILM_FIELDS.param = None,
+    response: Response = None,
     film_service: FilmService = Depends(get_film_service)
-) -> list[Film]:
-    films = await film_service.search(query, page_number, page_size)
-    return [
-        Film(uuid=film.id, title=film.title, imdb_rating=film.imdb_rating)
-        for film in films
-    ]
+) -> Response:
+    source = FILM_FIELDS.source(fields)
+    if cursor is None:
+        films = await film_service.search(query, page_number, page_size,
+                                          source)
+    else:
+        films = await get_cursor_page(
+            film_service.search_page(query, cursor, page_size, source),
+            response)
+    return FILM_FIELDS.response(films, fields, response)
+
+
+@router.get(
+    '/bulk',
+    response_model=list[FilmFull],
+    summary='Фильмы по списку id',
+    description='Возвращает найденные фильмы по списку id в том же порядке.',
+)
+async def film_bulk(
+    ids: Annotated[list[UUID],
+                   Query(description='id фильмов',
+                         min_items=1, max_items=settings.bulk_max_ids)],
+    fields: FILM_FULL_FIELDS.param = None,
+    response: Response = None,
+    film_service: FilmService = Depends(get_film_service),
+    creds: str = Depends(get_creds),
+    auth_service: AuthService = Depends(get_auth_service),
+) -> Response:
+    films = await film_service.get_many(list(dict.fromkeys(ids)))
+    if any(requires_subscription(film) for film in films):
+        await auth_service.check_access(creds, ['subscriber'])
+
+    return FILM_FULL_FIELDS.response([film.dict() for film in films],
+                                     fields, response)
 
 
 @router.get(
@@ -95,28 +187,26 @@ async def film_search(
         response_model=FilmFull,
         summary='Информация о фильме',
         description='Позволяет получить информацию о фильме по id.',
+        dependencies=[Depends(record_access('film_details', 'film_id'))],
 )
 async def film_details(
     film_id: UUID,
+    fields: FILM_FULL_FIELDS.param = None,
+    response: Response = None,
     film_service: FilmService = Depends(get_film_service),
     creds: str = Depends(get_creds),
     auth_service: AuthService = Depends(get_auth_service),
-) -> FilmFull:
+) -> Response:
     film = await film_service.get_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='film not found')
 
-    if film.imdb_rating >= 8.0:
+    if requires_subscription(film):
         await auth_service.check_access(creds, ['subscriber'])
 
-    return FilmFull(
-        uuid=film.id, title=film.title, imdb_rating=film.imdb_rating,
-        description=film.description,
-        genre=[Genre(uuid=genre.id, name=genre.name) for genre in film.genres],
-        **{
-            f'{role}s': [FilmPerson(uuid=fp.id, full_name=fp.name)
-                         for fp in getattr(film, f'{role}s')]
-            for role in ROLES
-        }
-    )
+    return FILM_FULL_FIELDS.response(film.dict(), fields, response)
+
+
+def requires_subscription(film: ESFilm) -> bool:
+    return (film.imdb_rating or 0) >= SUBSCRIBER_RATING
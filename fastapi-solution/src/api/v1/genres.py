@@ -1,8 +1,8 @@
 from http import HTTPStatus
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 
 from core.settings import settings
@@ -16,12 +16,27 @@ class Genre(BaseModel):
     name: str
 
 
+# Маршрут объявлен до /{genre_id}, иначе bulk попадёт в genre_id.
+@router.get('/bulk',
+            response_model=list[Genre],
+            summary='Жанры по списку id.',
+            description='Возвращает найденные жанры по списку id.',
+            response_description='Жанры фильмов')
+async def genre_bulk(
+        ids: Annotated[list[UUID],
+                       Query(description='id жанров',
+                             min_items=1, max_items=settings.bulk_max_ids)],
+        genre_service: GenreService = Depends(get_genre_service)
+) -> list[Genre]:
+    genres = await genre_service.get_many(list(dict.fromkeys(ids)))
+    return [Genre(uuid=genre.id, name=genre.name) for genre in genres]
+
+
 @router.get('/{genre_id}',
             response_model=Genre,
             summary='Информация о жанре.',
             description='Позволяет получить информацию о жанре по id.',
             response_description='Жанры фильмов')
-@cache(expire=settings.redis_cache_expire_seconds)
 async def genre_details(
         genre_id: str,
         genre_service: GenreService = Depends(get_genre_service)
@@ -39,7 +54,6 @@ async def genre_details(
             summary='Информация о жанрах.',
             description='Позволяет получить информацию о жанрах',
             response_description='Жанры фильмов')
-@cache(expire=settings.redis_cache_expire_seconds)
 async def all_genres(
         genre_service: GenreService = Depends(get_genre_service)
 ) -> list[Genre]:
@@ -1,16 +1,17 @@
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import Field
 
-from api.v1.films import Film
+from api.v1.fieldsets import Fieldset, SourceField, to_uuid
+from api.v1.films import CURSOR_DESCRIPTION, FILM_FIELDS, Film, get_cursor_page
 from core.settings import settings
+from db.access_stats import record_access
 from models.base import OrjsonBaseModel
-from models.person import ESPerson
 from services.person import PersonService, get_person_service
+from utils.cache import cache
 
 router = APIRouter()
 
@@ -26,13 +27,13 @@ class Person(OrjsonBaseModel):
     films: list[PersonFilm] = Field(title='Фильмы')
 
 
-def create_api_person(person: ESPerson) -> Person:
-    return Person(
-        uuid=person.id,
-        full_name=person.full_name,
-        films=[PersonFilm(uuid=pf.id, roles=pf.roles)
-               for pf in person.films]
-    )
+PERSON_FIELDS = Fieldset({
+    'uuid': SourceField('id', to_uuid),
+    'full_name': SourceField('full_name'),
+    'films': SourceField('films', lambda films: [
+        {'uuid': to_uuid(film['id']), 'roles': film['roles']}
+        for film in films]),
+})
 
 
 @router.get(
@@ -41,20 +42,48 @@ def create_api_person(person: ESPerson) -> Person:
     summary='Поиск по персонам',
     description='Возвращает список персон по поисковому запросу.',
 )
-@cache(expire=settings.redis_cache_expire_seconds)
+@cache(expire=settings.redis_cache_expire_seconds, namespace='persons',
+       uncached_params=['cursor'])
 async def person_search(
     query: Annotated[str, Query(description='Поисковый запрос')],
     page_number: Annotated[int,
                            Query(description='Номер страницы', ge=1)] = 1,
     page_size: Annotated[int,
                          Query(description='Размер страницы', ge=1)] = 50,
+    cursor: Annotated[Optional[str],
+                      Query(description=CURSOR_DESCRIPTION)] = None,
+    fields: PERSON_FIELDS.param = None,
+    response: Response = None,
     person_service: PersonService = Depends(get_person_service)
-) -> list[Person]:
-    persons = await person_service.search(query, page_number, page_size)
-    return [
-        create_api_person(person)
-        for person in persons
-    ]
+) -> Response:
+    source = PERSON_FIELDS.source(fields)
+    if cursor is None:
+        persons = await person_service.search(query, page_number, page_size,
+                                              source)
+    else:
+        persons = await get_cursor_page(
+            person_service.search_page(query, cursor, page_size, source),
+            response)
+    return PERSON_FIELDS.response(persons, fields, response)
+
+
+@router.get(
+    '/bulk',
+    response_model=list[Person],
+    summary='Персоны по списку id',
+    description='Возвращает найденные персоны по списку id в том же порядке.',
+)
+async def person_bulk(
+    ids: Annotated[list[UUID],
+                   Query(description='id персон',
+                         min_items=1, max_items=settings.bulk_max_ids)],
+    fields: PERSON_FIELDS.param = None,
+    response: Response = None,
+    person_service: PersonService = Depends(get_person_service)
+) -> Response:
+    persons = await person_service.get_many(list(dict.fromkeys(ids)))
+    return PERSON_FIELDS.response([person.dict() for person in persons],
+                                  fields, response)
 
 
 @router.get(
@@ -62,18 +91,21 @@ async def person_search(
     response_model=Person,
     summary='Информация о персоне',
     description='Позволяет получить информацию о персоне по id.',
+    dependencies=[Depends(record_access('person_details', 'person_id'))],
 )
-@cache(expire=settings.redis_cache_expire_seconds)
+@cache(expire=settings.redis_cache_expire_seconds, namespace='persons')
 async def person_details(
     person_id: UUID,
+    fields: PERSON_FIELDS.param = None,
+    response: Response = None,
     person_service: PersonService = Depends(get_person_service)
-) -> Person:
+) -> Response:
     person = await person_service.get_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail='person not found')
 
-    return create_api_person(person)
+    return PERSON_FIELDS.response(person.dict(), fields, response)
 
 
 @router.get(
@@ -82,13 +114,13 @@ async def person_details(
     summary='Список фильмов персоны',
     description='Возвращает список фильмов по id персоны.',
 )
-@cache(expire=settings.redis_cache_expire_seconds)
+@cache(expire=settings.redis_cache_expire_seconds, namespace='persons')
 async def person_films(
     person_id: UUID,
+    fields: FILM_FIELDS.param = None,
+    response: Response = None,
     person_service: PersonService = Depends(get_person_service)
-) -> list[Film]:
-    films = await person_service.list_films(person_id)
-    return [
-        Film(uuid=film.id, title=film.title, imdb_rating=film.imdb_rating)
-        for film in films
-    ]
+) -> Response:
+    films = await person_service.list_films(person_id,
+                                            FILM_FIELDS.source(fields))
+    return FILM_FIELDS.response(films, fields, response)
@@ -5,10 +5,115 @@ from pydantic import AnyUrl, BaseSettings, RedisDsn
 
 class Settings(BaseSettings):
     auth_url: Optional[AnyUrl] = None
+    # Сколько секунд помнить разрешение и отказ сервиса авторизации.
+    auth_cache_allow_seconds: int = 30
+    auth_cache_deny_seconds: int = 5
+    auth_cache_max_items: int = 10000
+    # Хранить решения ещё и в Redis, общими для всех worker'ов.
+    auth_cache_redis: bool = False
+    # Ключи для локальной проверки JWT: JWKS сервиса авторизации или файл
+    # с JWKS или PEM. Без них каждый токен проверяет сервис авторизации.
+    auth_jwks_url: Optional[AnyUrl] = None
+    auth_jwks_file: Optional[str] = None
+    auth_jwks_refresh_seconds: int = 300
+    auth_jwt_algorithms: list[str] = ['RS256']
+    auth_jwt_audience: Optional[str] = None
+    auth_jwt_issuer: Optional[str] = None
+    auth_jwt_roles_claim: str = 'roles'
+    # Тайм-ауты запросов к зависимостям, в секундах.
+    auth_timeout_seconds: float = 2
+    # Пул httpx для сервиса авторизации и JWKS. Здесь и ниже
+    # *_warmup_connections — сколько соединений пула открыть при старте.
+    http_pool_max_connections: int = 100
+    http_keepalive_connections: int = 20
+    http_keepalive_seconds: float = 60
+    http_warmup_connections: int = 1
     elastic_dsn: AnyUrl = 'http://127.0.0.1:9200'
+    elastic_timeout_seconds: float = 5
+    elastic_pool_max_connections: int = 10
+    elastic_keepalive_seconds: float = 60
+    elastic_warmup_connections: int = 2
+    # Запросы к Elastic дольше этого по времени ответа или took пишутся
+    # в журнал медленных запросов, 0 отключает журнал.
+    elastic_slow_query_ms: int = 500
+    # Сколько Elastic держит point in time для пагинации курсором.
+    elastic_pit_keep_alive: str = '1m'
+    # Окно, за которое get_by_id объединяются в один _mget. По умолчанию
+    # отключено: каждый get_by_id ждал бы окно и без одновременных
+    # запросов. Включать, если много одновременных запросов фильмов
+    # и персон по id, например ELASTIC_BATCH_WINDOW_MS=1.
+    elastic_batch_window_ms: float = 0
+    elastic_batch_max_size: int = 100
     redis_dsn: RedisDsn = 'redis://127.0.0.1:6379'
+    redis_timeout_seconds: float = 1
+    # Запрос ждёт свободного соединения не дольше redis_timeout_seconds.
+    redis_pool_max_connections: int = 50
+    redis_warmup_connections: int = 2
     redis_cache_expire_seconds: int = 300
+    # Сколько секунд после истечения отдавать запись, обновляя её в фоне.
+    redis_cache_stale_seconds: int = 60
+    redis_cache_lock_seconds: int = 10
+    # Сколько ещё хранить запись, чтобы отдать её, пока Elastic недоступен.
+    # Запись живёт в Redis expire + stale + grace секунд, и память Redis
+    # под кэш растёт в той же пропорции: с настройками по умолчанию
+    # в 1,6 раза. 0 отключает grace, в cache() его можно задать
+    # для отдельного namespace.
+    redis_cache_grace_seconds: int = 120
+    # Повторы вызовов Elastic, Redis и сервиса авторизации при отказе.
+    retry_max_attempts: int = 3
+    retry_backoff_base_ms: float = 50
+    retry_backoff_max_ms: float = 1000
+    # Сколько повторов всего может сделать один запрос к API.
+    retry_budget_per_request: int = 3
+    # После стольких отказов подряд зависимость не вызывается
+    # breaker_reset_seconds секунд, затем пропускается пробный вызов.
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 10
+    # Кэш в памяти worker'а перед Redis, 0 в любом из лимитов отключает его.
+    cache_local_max_items: int = 10000
+    cache_local_max_bytes: int = 64 * 1024 * 1024
+    cache_local_ttl_seconds: int = 10
+    cache_local_namespace_ttl_seconds: dict[str, int] = {}
+    # Значения кэша от этого размера сжимаются zlib, 0 отключает сжатие.
+    cache_compress_min_bytes: int = 1024
+    cache_compress_level: int = 6
+    # Статистика обращений: как часто worker сбрасывает её в Redis, во
+    # сколько раз счётчики уменьшаются за цикл прогрева и сколько хранится.
+    access_stats_flush_seconds: int = 10
+    access_stats_decay: float = 0.9
+    access_stats_max_members: int = 1000
+    # Прогрев кэша по статистике: период, число самых частых обращений
+    # каждого вида и одновременных загрузок. 0 в cache_warm_top отключает.
+    cache_warm_interval_seconds: int = 60
+    cache_warm_top: int = 100
+    cache_warm_concurrency: int = 4
+    # Трассировка запросов: доля трассируемых запросов без заголовка
+    # traceparent, куда и как часто выгружать спаны в формате OTLP JSON.
+    # Без файла и коллектора трассировка отключена.
+    tracing_sample_ratio: float = 0
+    tracing_export_file: Optional[str] = None
+    tracing_otlp_endpoint: Optional[AnyUrl] = None
+    tracing_export_seconds: float = 5
+    tracing_service_name: str = 'movies-api'
+    # Профилирование запросов: доля профилируемых запросов, интервал
+    # снятия стека, каталог профилей и сколько их хранить. Запросы
+    # с заголовком X-Profile-Token, равным admin_token, профилируются всегда.
+    # Каталог по умолчанию — в рабочем каталоге приложения, а не в общем
+    # для всех пользователей /tmp.
+    profiling_sample_ratio: float = 0
+    profiling_interval_ms: float = 5
+    profiling_dir: str = 'profiles'
+    profiling_max_files: int = 100
+    # Как часто перечитывать снимок жанров в памяти worker'а.
+    genre_snapshot_refresh_seconds: int = 60
     log_level: str = 'INFO'
+    # Наибольшее число id в одном запросе к ручкам bulk.
+    bulk_max_ids: int = 100
+    # Наибольший размер страницы с курсором, больший уменьшается до него:
+    # не больше index.max_result_window Elastic, иначе он отклоняет запрос.
+    max_page_size: int = 1000
+    # Токен для заголовка X-Admin-Token, без него служебные ручки отключены.
+    admin_token: Optional[str] = None
 
 
 settings = Settings()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Iterable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request
+from redis.asyncio import Redis
+
+from db import redis as redis_db
+from utils.cache import is_refreshing
+
+logger = logging.getLogger(__name__)
+
+STATS_PREFIX = 'fastapi-cache:stats'
+# Сколько разных обращений worker копит в памяти между сбросами в Redis.
+MAX_PENDING = 10000
+
+
+class AccessStats:
+    """Счётчики обращений к ручкам в сортированных множествах Redis.
+
+    Обращения копятся в памяти worker'а и раз в несколько секунд
+    добавляются в Redis одним pipeline, поэтому учёт не стоит запросу
+    обращения к Redis. decay уменьшает все счётчики, чтобы вверху
+    оставалось то, что запрашивают сейчас.
+    """
+
+    def __init__(self):
+        self._pending: Counter[tuple[str, str]] = Counter()
+
+    def record(self, kind: str, member: str) -> None:
+        key = (kind, member)
+        if key in self._pending or len(self._pending) < MAX_PENDING:
+            self._pending[key] += 1
+
+    async def flush(self, redis: Redis) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+
+        async def write() -> None:
+            async with redis.pipeline(transaction=False) as pipe:
+                for (kind, member), count in pending.items():
+                    pipe.zincrby(f'{STATS_PREFIX}:{kind}', count, member)
+                await pipe.execute()
+
+        await redis_db.dependency.call(write)
+
+    async def flush_periodically(self, redis: Redis, interval: float
+                                 ) -> None:
+        """Сбрасывает счётчики в Redis каждые interval секунд до отмены."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(redis)
+            except Exception:
+                logger.warning('Access stats flush failed', exc_info=True)
+
+    async def top(self, redis: Redis, kind: str, count: int) -> list[str]:
+        members = await redis_db.dependency.call(
+            redis.zrevrange, f'{STATS_PREFIX}:{kind}', 0, count - 1)
+        return [member.decode() for member in members]
+
+    async def decay(self, redis: Redis, kinds: Iterable[str], factor: float,
+                    keep: int) -> None:
+        """Умножает счётчики на factor и оставляет keep самых больших."""
+        async def write() -> None:
+            async with redis.pipeline(transaction=False) as pipe:
+                for kind in kinds:
+                    key = f'{STATS_PREFIX}:{kind}'
+                    pipe.zunionstore(key, {key: factor})
+                    pipe.zremrangebyrank(key, 0, -keep - 1)
+                await pipe.execute()
+
+        await redis_db.dependency.call(write)
+
+
+access_stats = AccessStats()
+
+
+def record_access(kind: str, path_param: Optional[str] = None,
+                  uncached_params: Iterable[str] = ()
+                  ) -> Callable[[Request], Awaitable[None]]:
+    """Зависимость FastAPI, которая учитывает обращение к ручке.
+
+    Обращение учитывается по значению path_param или, без него, по строке
+    запроса с отсортированными параметрами. Как и в cache, запросы
+    с параметрами из uncached_params не учитываются. Запросы прогрева
+    кэша тоже не учитываются.
+    """
+    async def dependency(request: Request) -> None:
+        if is_refreshing() or any(param in request.query_params
+                                  for param in uncached_params):
+            return
+        if path_param:
+            member = str(request.path_params[path_param])
+        else:
+            member = urlencode(sorted(request.query_params.multi_items()))
+        access_stats.record(kind, member)
+
+    return dependency
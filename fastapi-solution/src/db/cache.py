@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+from uuid import uuid4
+
+import orjson
+from fastapi_cache.backends.redis import RedisBackend
+from redis.asyncio.client import AbstractRedis
+from redis.exceptions import RedisError
+
+from utils.metrics import (LOCAL_CACHE_BYTES, LOCAL_CACHE_ITEMS,
+                           LOCAL_CACHE_REQUESTS, REDIS_DURATION, timed)
+from utils.resilience import Dependency
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'fastapi-cache:invalidation'
+# Подписка ждёт сообщений не дольше этого, чтобы тайм-аут сокета Redis
+# не обрывал её, пока сообщений нет.
+INVALIDATION_POLL_SECONDS = 30
+
+# Получает ключи сброшенных тегов, пустой список — сброшено всё.
+InvalidationListener = Callable[[list[str]], Awaitable[None]]
+
+
+def key_namespace(key: str) -> str:
+    """Возвращает namespace из ключа вида '{prefix}:{namespace}:{hash}'."""
+    parts = key.split(':', 2)
+    return parts[1] if len(parts) == 3 else ''
+
+
+class LocalCache:
+    """LRU-кэш в памяти процесса с ограничением по числу записей и объёму.
+
+    Для каждой записи хранится время истечения в Redis, чтобы отдавать
+    корректный оставшийся TTL, и собственное время жизни в памяти, которое
+    не превышает лимит для namespace. Попадания, промахи, число записей
+    и объём кэша отдаются в метриках Prometheus.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int, ttl: int,
+                 namespace_ttl: Optional[dict[str, int]] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.namespace_ttl = namespace_ttl or {}
+        self._entries: OrderedDict[str, tuple[bytes, float, float]] = (
+            OrderedDict())
+        self._size = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 and self.max_bytes > 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        """Возвращает оставшийся TTL в Redis и значение или None."""
+        namespace = key_namespace(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, deadline = entry
+            now = time.monotonic()
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                LOCAL_CACHE_REQUESTS.labels(namespace, 'hit').inc()
+                return max(int(deadline - now), 0), value
+            self.delete(key)
+
+        LOCAL_CACHE_REQUESTS.labels(namespace, 'miss').inc()
+        return None
+
+    def set(self, key: str, value: bytes, expire: Optional[int]) -> None:
+        """Сохраняет значение, expire — оставшийся TTL записи в Redis."""
+        self.delete(key)
+        ttl = self.namespace_ttl.get(key_namespace(key), self.ttl)
+        if expire is not None and expire > 0:
+            ttl = min(ttl, expire)
+        entry_size = len(key) + len(value)
+        if ttl <= 0 or entry_size > self.max_bytes:
+            return
+
+        now = time.monotonic()
+        deadline = now + expire if expire and expire > 0 else now + ttl
+        self._entries[key] = (value, now + ttl, deadline)
+        self._size += entry_size
+        LOCAL_CACHE_ITEMS.inc()
+        LOCAL_CACHE_BYTES.inc(entry_size)
+        while (len(self._entries) > self.max_items
+               or self._size > self.max_bytes):
+            self.delete(next(iter(self._entries)))
+
+    def delete(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry_size = len(key) + len(entry[0])
+        self._size -= entry_size
+        LOCAL_CACHE_ITEMS.dec()
+        LOCAL_CACHE_BYTES.dec(entry_size)
+        return True
+
+    def clear(self, prefix: str = '') -> int:
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+
+class TieredRedisBackend(RedisBackend):
+    """Backend для fastapi_cache с кэшем в памяти worker'а перед Redis.
+
+    Горячие ключи отдаются из памяти без обращения к Redis. Запись в памяти
+    живёт не дольше лимита для namespace, поэтому данные, обновлённые в Redis
+    другим worker'ом, становятся видны не позже, чем через этот лимит.
+
+    Запросы к Redis идут через dependency: с повторами и предохранителем,
+    который при недоступном Redis сразу отклоняет их вместо ожидания
+    тайм-аута.
+    """
+
+    def __init__(self, redis: AbstractRedis, local_cache: LocalCache,
+                 dependency: Dependency):
+        super().__init__(redis)
+        self.local_cache = local_cache
+        self.dependency = dependency
+        # По id отличаем свои сообщения об инвалидации от чужих.
+        self.instance_id = uuid4().hex
+        self._invalidation_listeners: list[InvalidationListener] = []
+        self._listener_tasks: set[asyncio.Task] = set()
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        if self.local_cache.enabled:
+            cached = self.local_cache.get(key)
+            if cached is not None:
+                return cached
+
+        ttl, value = await self.dependency.call(
+            timed, REDIS_DURATION.labels('get'), super().get_with_ttl, key)
+        if value is not None and self.local_cache.enabled:
+            self.local_cache.set(key, value, ttl)
+        return ttl, value
+
+    async def get_many_with_ttl(self, keys: list[str]
+                                ) -> list[Tuple[int, Optional[bytes]]]:
+        """Как get_with_ttl для нескольких ключей за один запрос к Redis."""
+        results = [self.local_cache.get(key)
+                   if self.local_cache.enabled else None for key in keys]
+        missing = [i for i, cached in enumerate(results) if cached is None]
+        if missing:
+            values = await self.dependency.call(
+                timed, REDIS_DURATION.labels('get_many'),
+                self._get_many_with_ttl, [keys[i] for i in missing])
+            for n, i in enumerate(missing):
+                ttl, value = values[2 * n], values[2 * n + 1]
+                results[i] = ttl, value
+                if value is not None and self.local_cache.enabled:
+                    self.local_cache.set(keys[i], value, ttl)
+        return results
+
+    async def _get_many_with_ttl(self, keys: list[str]) -> list:
+        async with self.redis.pipeline(
+                transaction=not self.is_cluster) as pipe:
+            for key in keys:
+                pipe.ttl(key).get(key)
+            return await pipe.execute()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes | str,
+                  expire: Optional[int] = None) -> None:
+        if isinstance(value, str):
+            value = value.encode()
+        await self.dependency.call(timed, REDIS_DURATION.labels('set'),
+                                   super().set, key, value, expire)
+        if self.local_cache.enabled:
+            self.local_cache.set(key, value, expire)
+
+    async def acquire_lock(self, key: str, expire: int) -> bool:
+        """Берёт блокировку на ключ, которая сама истекает через expire."""
+        return bool(await self.dependency.call(
+            timed, REDIS_DURATION.labels('lock'),
+            self.redis.set, f'{key}:lock', 1, nx=True, ex=expire))
+
+    async def add_tags(self, key: str, tag_keys: Iterable[str],
+                       expire: Optional[int] = None) -> None:
+        """Добавляет ключ в множества тегов, по которым его можно сбросить.
+
+        Множество тега живёт не меньше самого долгоживущего из его ключей:
+        его TTL только продлевается (EXPIRE NX и GT, Redis 7).
+        """
+        await self.dependency.call(timed, REDIS_DURATION.labels('add_tags'),
+                                   self._add_tags, key, list(tag_keys),
+                                   expire)
+
+    async def _add_tags(self, key: str, tag_keys: list[str],
+                        expire: Optional[int]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.sadd(tag_key, key)
+                if expire:
+                    # NX задаёт TTL новому множеству, GT продлевает его.
+                    pipe.expire(tag_key, expire, nx=True)
+                    pipe.expire(tag_key, expire, gt=True)
+                else:
+                    pipe.persist(tag_key)
+            await pipe.execute()
+
+    def add_invalidation_listener(self,
+                                  listener: InvalidationListener) -> None:
+        """Подписывает на сброс тегов в этом и в других worker'ах."""
+        self._invalidation_listeners.append(listener)
+
+    async def invalidate_tags(self, tag_keys: Iterable[str]) -> int:
+        """Удаляет все ключи с указанными тегами и сами множества тегов.
+
+        Остальным worker'ам рассылается сообщение, чтобы они удалили эти
+        ключи из локального кэша. Возвращает число удалённых ключей.
+        """
+        tag_keys = list(tag_keys)
+        if not tag_keys:
+            return 0
+
+        members = await self.dependency.call(self._tag_members, tag_keys)
+        keys = sorted({key.decode() if isinstance(key, bytes) else key
+                       for tag_members in members for key in tag_members})
+
+        deleted = (await self.dependency.call(self.redis.delete, *keys)
+                   if keys else 0)
+        await self.dependency.call(self.redis.delete, *tag_keys)
+        self._drop_local(keys)
+        if (keys and self.local_cache.enabled) or self._invalidation_listeners:
+            await self.dependency.call(
+                self.redis.publish, INVALIDATION_CHANNEL, orjson.dumps(
+                    {'sender': self.instance_id, 'keys': keys,
+                     'tags': tag_keys}))
+        # Свои подписчики отрабатывают до ответа, чтобы вызвавший сброс
+        # сразу видел свежие данные.
+        await self._notify(tag_keys)
+        return deleted
+
+    async def _tag_members(self, tag_keys: list[str]) -> list[set]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            return await pipe.execute()
+
+    async def listen_invalidations(self) -> None:
+        """Удаляет из локального кэша ключи, сброшенные другими worker'ами.
+
+        Работает до отмены задачи, в которой запущен, и переподключается
+        при потере соединения с Redis.
+        """
+        while True:
+            try:
+                await self._listen_invalidations()
+            except RedisError:
+                logger.warning('Cache invalidation subscription lost',
+                               exc_info=True)
+                # Пока подписки не было, сообщения могли потеряться.
+                self.local_cache.clear()
+                self._notify_in_background([])
+                await asyncio.sleep(1)
+
+    async def _listen_invalidations(self) -> None:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=INVALIDATION_POLL_SECONDS)
+                if message is None:
+                    continue
+                try:
+                    data = orjson.loads(message['data'])
+                except orjson.JSONDecodeError:
+                    logger.warning('Invalid cache invalidation message')
+                    continue
+                if data.get('sender') != self.instance_id:
+                    self._drop_local(data.get('keys', []))
+                    self._notify_in_background(data.get('tags', []))
+        finally:
+            await pubsub.close()
+
+    async def _notify(self, tag_keys: list[str]) -> None:
+        for listener in self._invalidation_listeners:
+            try:
+                await listener(tag_keys)
+            except Exception:
+                logger.warning('Cache invalidation listener failed',
+                               exc_info=True)
+
+    def _notify_in_background(self, tag_keys: list[str]) -> None:
+        # Подписчики не задерживают разбор следующих сообщений.
+        if self._invalidation_listeners:
+            task = asyncio.create_task(self._notify(tag_keys))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_tasks.discard)
+
+    def _drop_local(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.local_cache.delete(key)
+
+    async def clear(self, namespace: Optional[str] = None,
+                    key: Optional[str] = None) -> int:
+        if namespace:
+            self.local_cache.clear(f'{namespace}:')
+        elif key:
+            self.local_cache.delete(key)
+        return await self.dependency.call(super().clear, namespace, key)
@@ -1,5 +1,20 @@
 from typing import Optional
 
 from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from utils.resilience import Dependency
 
 redis: Optional[Redis] = None
+
+
+def is_redis_failure(error: BaseException) -> bool:
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+# Общая для кэша и AuthService: они ходят в один и тот же Redis.
+dependency = Dependency('redis', is_redis_failure)
+
+
+async def get_redis() -> Redis:
+    return redis
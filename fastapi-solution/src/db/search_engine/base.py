@@ -1,14 +1,24 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional
 from uuid import UUID
 
 
+class InvalidCursorError(ValueError):
+    pass
+
+
 class SearchEngine(ABC):
     @abstractmethod
     async def get_by_id(self, index: str, id: UUID, fields: list[str]
                         ) -> Any | None:
         pass
 
+    @abstractmethod
+    async def get_many(self, index: str, ids: list[UUID], fields: list[str]
+                       ) -> list[Any | None]:
+        """Возвращает документы в порядке ids, None — для ненайденных."""
+        pass
+
     @abstractmethod
     async def get_list(
         self, index: str, fields: list[str],
@@ -18,3 +28,33 @@ class SearchEngine(ABC):
         page_number: int = 1, page_size: int = 1000
     ) -> list[Any]:
         pass
+
+    @abstractmethod
+    async def get_list_matched(
+        self, index: str, fields: list[str],
+        filter_fields: dict[str, list[UUID]],
+        page_size: int = 1000
+    ) -> list[tuple[Any, list[str]]]:
+        """Возвращает все документы, у которых в любом из вложенных списков
+        filter_fields есть один из id.
+
+        Для каждого документа возвращаются совпавшие пары '{field}:{id}'.
+        Документ может вернуться несколько раз с разными совпадениями.
+        page_size — размер страницы, которыми документы загружаются.
+        """
+        pass
+
+    @abstractmethod
+    async def get_list_after(
+        self, index: str, fields: list[str],
+        search_fields: dict[str, str] = {},
+        filter_fields: dict[str, list[UUID]] = {},
+        sort_params: list[str] = [],
+        cursor: Optional[str] = None, page_size: int = 1000
+    ) -> tuple[list[Any], Optional[str]]:
+        """Возвращает страницу и непрозрачный курсор следующей страницы.
+
+        Без курсора возвращает первую страницу. Для последней страницы курсор
+        — None. Для неверного или истёкшего курсора — InvalidCursorError.
+        """
+        pass
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, Optional
+from uuid import UUID
+
+from db.search_engine.base import SearchEngine
+from db.search_engine.slow_log import batch_callers, caller, slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self):
+        self.futures: dict[str, asyncio.Future] = {}
+        self.callers: set[str] = set()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class BatchingSearchEngine(SearchEngine):
+    """Объединяет одновременные get_by_id в один запрос get_many.
+
+    Запросы к одному индексу с одинаковыми полями копятся window секунд или
+    до max_size разных id, затем загружаются одним get_many, и результаты
+    раздаются ожидающим корутинам. Остальные методы передаются как есть.
+    """
+
+    def __init__(self, search_engine: SearchEngine, window: float,
+                 max_size: int):
+        self.search_engine = search_engine
+        self.window = window
+        self.max_size = max_size
+        self._batches: dict[tuple[str, tuple[str, ...]], _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def close(self):
+        await self.search_engine.close()
+
+    async def ping(self) -> None:
+        await self.search_engine.ping()
+
+    async def get_by_id(self, index: str, id: UUID, fields: list[str]
+                        ) -> Any | None:
+        key = (index, tuple(fields))
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window, self._dispatch, key)
+
+        if slow_queries.threshold_ms > 0:
+            batch.callers.add(caller())
+        future = batch.futures.get(str(id))
+        if future is None:
+            future = batch.futures[str(id)] = (
+                asyncio.get_running_loop().create_future())
+            if len(batch.futures) >= self.max_size:
+                self._dispatch(key)
+
+        # Отмена одного запроса не должна отменять результат для остальных
+        # запросов того же id.
+        return await asyncio.shield(future)
+
+    def _dispatch(self, key: tuple[str, tuple[str, ...]]) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+
+        batch.timer.cancel()
+        task = asyncio.create_task(self._load(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, key: tuple[str, tuple[str, ...]], batch: _Batch
+                    ) -> None:
+        index, fields = key
+        ids = list(batch.futures)
+        # Задача выполняется в своей копии контекста.
+        batch_callers.set(tuple(sorted(batch.callers)))
+        try:
+            docs = await self.search_engine.get_many(index, ids, list(fields))
+        except Exception as e:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Исключение получат ожидающие, если они ещё есть.
+                    future.exception()
+            return
+
+        for id, doc in zip(ids, docs):
+            future = batch.futures[id]
+            if not future.done():
+                future.set_result(doc)
+
+    async def get_many(self, index: str, ids: list[UUID], fields: list[str]
+                       ) -> list[Any | None]:
+        return await self.search_engine.get_many(index, ids, fields)
+
+    async def get_list(self, *args, **kwargs) -> list[Any]:
+        return await self.search_engine.get_list(*args, **kwargs)
+
+    async def get_list_matched(self, *args, **kwargs
+                               ) -> list[tuple[Any, list[str]]]:
+        return await self.search_engine.get_list_matched(*args, **kwargs)
+
+    async def get_list_after(self, *args, **kwargs
+                             ) -> tuple[list[Any], Optional[str]]:
+        return await self.search_engine.get_list_after(*args, **kwargs)
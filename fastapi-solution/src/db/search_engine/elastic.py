@@ -1,28 +1,137 @@
-from typing import Any, Optional
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from time import perf_counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 from uuid import UUID
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
+import aiohttp
+import orjson
+from elasticsearch import (AIOHttpConnection, AsyncElasticsearch,
+                           ConnectionError, NotFoundError, RequestError,
+                           TransportError)
+from elasticsearch._async.compat import get_running_loop
+from elasticsearch._async.http_aiohttp import ESClientResponse
 from pydantic import AnyUrl
 
-from db.search_engine.base import SearchEngine
+from core.settings import settings
+from db.search_engine.base import InvalidCursorError, SearchEngine
+from db.search_engine.slow_log import caller, slow_queries
+from utils.metrics import ELASTIC_DURATION, ELASTIC_TOOK
+from utils.resilience import Dependency
+from utils.tracing import KIND_CLIENT, span
+
+# Число именованных условий в одном запросе, чтобы не упереться
+# в indices.query.bool.max_clause_count.
+MAX_NAMED_QUERIES = 1000
+
+
+def is_elastic_failure(error: BaseException) -> bool:
+    """Отказ Elastic: нет соединения, тайм-аут, перегрузка или ошибка
+    сервера. Ошибки запроса вроде 404 или 400 отказом не считаются.
+    """
+    if isinstance(error, ConnectionError):
+        return True
+    return (isinstance(error, TransportError)
+            and isinstance(error.status_code, int)
+            and (error.status_code == 429 or error.status_code >= 500))
+
+
+class KeepAliveConnection(AIOHttpConnection):
+    """Соединение с Elastic, которое держит простаивающие сокеты открытыми
+    keepalive_timeout секунд, а не 15, как aiohttp по умолчанию.
+    """
+
+    def __init__(self, *args, keepalive_timeout: float = 15, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keepalive_timeout = keepalive_timeout
+
+    async def _create_aiohttp_session(self):
+        # Как в AIOHttpConnection, но с keepalive_timeout у TCPConnector.
+        if self.loop is None:
+            self.loop = get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            auto_decompress=True,
+            loop=self.loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit, use_dns_cache=True, ssl=self._ssl_context,
+                keepalive_timeout=self.keepalive_timeout,
+            ),
+        )
 
 
 class ElasticSearchEngine(SearchEngine):
-    def __init__(self, hosts: list[AnyUrl]):
-        self.elastic = AsyncElasticsearch(hosts=hosts)
+    def __init__(self, hosts: list[AnyUrl],
+                 dependency: Optional[Dependency] = None):
+        # Повторяет запросы Dependency, а не клиент: у клиента нет
+        # задержки между попытками и общего для запроса бюджета.
+        self.elastic = AsyncElasticsearch(
+            hosts=hosts, timeout=settings.elastic_timeout_seconds,
+            max_retries=0, connection_class=KeepAliveConnection,
+            maxsize=settings.elastic_pool_max_connections,
+            keepalive_timeout=settings.elastic_keepalive_seconds)
+        self.dependency = dependency or Dependency('elasticsearch',
+                                                   is_elastic_failure)
 
     async def close(self):
         await self.elastic.close()
 
+    async def ping(self) -> None:
+        """Проверяет соединение запросом, который не трогает индексы."""
+        await self.elastic.transport.perform_request('HEAD', '/')
+
+    async def _request(self, operation: str, index: str,
+                       func: Callable[..., Awaitable[Any]], /, *args,
+                       **kwargs) -> Any:
+        """Вызывает метод клиента и записывает время запроса и took.
+
+        Медленные запросы, в том числе оборванные по тайм-ауту, пишутся
+        в slow_queries.
+        """
+        with span(f'elasticsearch.{operation}', KIND_CLIENT,
+                  **{'db.system': 'elasticsearch',
+                     'db.elasticsearch.index': index}) as request_span:
+            start = perf_counter()
+            result = took = None
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                ELASTIC_DURATION.labels(operation, index).observe(duration)
+                if isinstance(result, dict) and 'took' in result:
+                    took = result['took']
+                    ELASTIC_TOOK.labels(operation, index).observe(took / 1000)
+                    request_span.set(**{'db.elasticsearch.took_ms': took})
+                if slow_queries.is_slow(duration * 1000, took):
+                    slow_queries.record(operation, index, kwargs.get('body'),
+                                        result, duration * 1000, took,
+                                        caller())
+            return result
+
     async def get_by_id(self, index: str, id: UUID, fields: list[str]
                         ) -> Any | None:
         try:
-            doc = await self.elastic.get(index, id, _source=fields)
+            doc = await self.dependency.call(
+                self._request, 'get', index,
+                self.elastic.get, index, id, _source=fields)
         except NotFoundError:
             return None
 
         return doc['_source']
 
+    async def get_many(self, index: str, ids: list[UUID], fields: list[str]
+                       ) -> list[Any | None]:
+        if not ids:
+            return []
+
+        docs = await self.dependency.call(
+            self._request, 'mget', index, self.elastic.mget,
+            body={'ids': [str(id) for id in ids]}, index=index,
+            _source=fields)
+        return [doc['_source'] if doc.get('found') else None
+                for doc in docs['docs']]
+
     async def get_list(
         self, index: str, fields: list[str] = ['*'],
         search_fields: dict[str, str] = {},
@@ -35,6 +144,163 @@ class ElasticSearchEngine(SearchEngine):
         if not search_size:
             return []
 
+        query = ElasticSearchEngine.build_query(search_fields,
+                                                filter_fields)
+        docs = await self.dependency.call(
+            self._request, 'search', index, self.elastic.search,
+            body={
+                "query": query,
+                "sort": [ElasticSearchEngine.sort_param_query(param)
+                         for param in sort_params],
+                "_source": fields,
+                "from": search_from,
+                "size": search_size,
+            },
+            index=index
+        )
+        return [doc['_source'] for doc in docs['hits']['hits']]
+
+    async def get_list_matched(
+        self, index: str, fields: list[str],
+        filter_fields: dict[str, list[UUID]],
+        page_size: int = 1000
+    ) -> list[tuple[Any, list[str]]]:
+        """Возвращает все совпавшие документы, без ограничения на их число.
+
+        Условия запрашиваются группами по MAX_NAMED_QUERIES, поэтому один
+        документ может вернуться несколько раз с разными совпадениями.
+        """
+        pairs = [(field, id) for field, ids in filter_fields.items()
+                 for id in ids]
+        result = []
+        for start in range(0, len(pairs), MAX_NAMED_QUERIES):
+            body = {
+                "query": ElasticSearchEngine.build_named_filter(
+                    pairs[start:start + MAX_NAMED_QUERIES]),
+                "_source": fields,
+                "size": page_size,
+            }
+            async for doc in self._search_all(index, body):
+                result.append((doc['_source'],
+                               doc.get('matched_queries', [])))
+        return result
+
+    async def _search_all(self, index: str, body: dict
+                          ) -> AsyncIterator[dict]:
+        """Перебирает все документы поиска страницами по body['size'].
+
+        Обычно всё помещается в первую страницу, и хватает одного запроса.
+        Иначе поиск повторяется по point in time с search_after.
+        """
+        docs = await self.dependency.call(
+            self._request, 'search_matched', index, self.elastic.search,
+            body={**body, 'sort': ['_doc']}, index=index)
+        hits = docs['hits']['hits']
+        if len(hits) < body['size']:
+            for doc in hits:
+                yield doc
+            return
+
+        pit_id = await self._open_pit(index)
+        search_after = None
+        try:
+            while True:
+                page_body = {
+                    **body,
+                    'sort': [{'_shard_doc': 'asc'}],
+                    'pit': {'id': pit_id,
+                            'keep_alive': settings.elastic_pit_keep_alive},
+                }
+                if search_after:
+                    page_body['search_after'] = search_after
+                docs = await self.dependency.call(
+                    self._request, 'search_matched', index,
+                    self.elastic.search, body=page_body)
+                pit_id = docs.get('pit_id', pit_id)
+                hits = docs['hits']['hits']
+                for doc in hits:
+                    yield doc
+                if len(hits) < body['size']:
+                    break
+                search_after = hits[-1]['sort']
+        finally:
+            await self._close_pit(index, pit_id)
+
+    async def _open_pit(self, index: str) -> str:
+        pit = await self.dependency.call(
+            self._request, 'open_pit', index,
+            self.elastic.transport.perform_request,
+            'POST', f'/{index}/_pit',
+            params={'keep_alive': settings.elastic_pit_keep_alive})
+        return pit['id']
+
+    async def _close_pit(self, index: str, pit_id: str) -> None:
+        await self.dependency.call(
+            self._request, 'close_pit', index,
+            self.elastic.transport.perform_request,
+            'DELETE', '/_pit', body={'id': pit_id})
+
+    async def get_list_after(
+        self, index: str, fields: list[str] = ['*'],
+        search_fields: dict[str, str] = {},
+        filter_fields: dict[str, list[UUID]] = {},
+        sort_params: list[str] = [],
+        cursor: Optional[str] = None, page_size: int = 1000
+    ) -> tuple[list[Any], Optional[str]]:
+        """Возвращает страницу документов и курсор следующей страницы.
+
+        Поиск идёт по point in time, открытому на первой странице, поэтому
+        выдача не меняется при обновлении индекса, а глубокие страницы
+        стоят столько же, сколько первая, и не ограничены 10000 документов.
+        На последней странице point in time закрывается и курсор — None.
+        page_size больше settings.max_page_size уменьшается до него, как
+        и в page_from_size.
+        """
+        page_size = min(page_size, settings.max_page_size)
+        if cursor:
+            pit_id, search_after = ElasticSearchEngine.decode_cursor(cursor)
+        else:
+            pit_id, search_after = await self._open_pit(index), None
+
+        body = {
+            'query': ElasticSearchEngine.build_query(search_fields,
+                                                     filter_fields),
+            'sort': [
+                *([ElasticSearchEngine.sort_param_query(param)
+                   for param in sort_params] or ['_score']),
+                # Уникальный порядок документов, нужен для search_after.
+                {'_shard_doc': 'asc'},
+            ],
+            '_source': fields,
+            'size': page_size,
+            'pit': {'id': pit_id,
+                    'keep_alive': settings.elastic_pit_keep_alive},
+        }
+        if search_after:
+            body['search_after'] = search_after
+
+        try:
+            docs = await self.dependency.call(
+                self._request, 'search_after', index, self.elastic.search,
+                body=body)
+        except (NotFoundError, RequestError) as e:
+            if cursor:
+                raise InvalidCursorError('Cursor is invalid or expired') from e
+            raise
+
+        hits = docs['hits']['hits']
+        pit_id = docs.get('pit_id', pit_id)
+        if len(hits) < page_size:
+            await self._close_pit(index, pit_id)
+            return [doc['_source'] for doc in hits], None
+
+        next_cursor = ElasticSearchEngine.encode_cursor(pit_id,
+                                                        hits[-1]['sort'])
+        return [doc['_source'] for doc in hits], next_cursor
+
+    @staticmethod
+    def build_query(search_fields: dict[str, str],
+                    filter_fields: dict[str, list[UUID]]) -> dict:
         query = {'bool': {'must': {'match_all': {}}}}
         if search_fields:
             query['bool']['must'] = [
@@ -69,18 +335,37 @@ class ElasticSearchEngine(SearchEngine):
                 }
             }
 
-        docs = await self.elastic.search(
-            body={
-                "query": query,
-                "sort": [ElasticSearchEngine.sort_param_query(param)
-                         for param in sort_params],
-                "_source": fields,
-                "from": search_from,
-                "size": search_size,
-            },
-            index=index
-        )
-        return [doc['_source'] for doc in docs['hits']['hits']]
+        return query
+
+    @staticmethod
+    def build_named_filter(pairs: list[tuple[str, UUID]]) -> dict:
+        """Фильтр, в котором условие для каждой пары поля и id названо
+        '{field}:{id}'.
+
+        Elastic возвращает в matched_queries документа имена совпавших
+        условий, поэтому не нужно загружать и разбирать вложенные списки.
+        """
+        return {
+            "bool": {
+                "filter": {
+                    "bool": {
+                        "should": [
+                            {
+                                "nested": {
+                                    "path": field,
+                                    "query": {
+                                        "term": {f'{field}.id': str(id)}
+                                    },
+                                    "_name": f'{field}:{id}'
+                                }
+                            }
+                            for field, id in pairs
+                        ],
+                        "minimum_should_match": 1
+                    }
+                }
+            }
+        }
 
     @staticmethod
     def sort_param_query(sort_param: str):
@@ -92,6 +377,19 @@ class ElasticSearchEngine(SearchEngine):
 
         return {field: 'desc' if sort_param.startswith('-') else 'asc'}
 
+    @staticmethod
+    def encode_cursor(pit_id: str, search_after: list) -> str:
+        return urlsafe_b64encode(
+            orjson.dumps({'pit': pit_id, 'after': search_after})).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[str, list]:
+        try:
+            data = orjson.loads(urlsafe_b64decode(cursor.encode()))
+            return data['pit'], data['after']
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidCursorError('Cursor is malformed') from e
+
     @staticmethod
     def page_from_size(page_number: int, page_size: int) -> tuple[int, int]:
         """По параметрам страницы возвращает from и size для поиска в Elastic.
@@ -106,8 +404,8 @@ class ElasticSearchEngine(SearchEngine):
         return search_from, search_size
 
 
-search_engine: Optional[ElasticSearchEngine] = None
+search_engine: Optional[SearchEngine] = None
 
 
-async def get_elastic_search_engine() -> ElasticSearchEngine:
+async def get_elastic_search_engine() -> SearchEngine:
     return search_engine
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import sys
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import orjson
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных отпечатков запросов worker хранит, новые сверх этого
+# не учитываются.
+MAX_FINGERPRINTS = 1000
+# Модули, которые стоят между сервисом и клиентом Elastic, их вызовы
+# не считаются источником запроса.
+_ENGINE_MODULES = ('db.search_engine.', 'utils.resilience', 'utils.metrics')
+# Источники запросов, собранных в пачку: пачка загружается из отдельной
+# задачи, в стеке которой их нет.
+batch_callers: ContextVar[Optional[tuple[str, ...]]] = ContextVar(
+    'batch_callers', default=None)
+
+
+def normalize(body: Any) -> Any:
+    """Запрос без значений: только его структура.
+
+    Значения заменяются на '?', списки значений — на ['?'], так как число
+    id в фильтре не меняет вид запроса, а одинаковые элементы списков
+    условий остаются в одном экземпляре.
+    """
+    if isinstance(body, dict):
+        return {key: normalize(value) for key, value in body.items()}
+    if isinstance(body, (list, tuple)):
+        items, seen = [], set()
+        for item in body:
+            item = normalize(item)
+            item_key = orjson.dumps(item, option=orjson.OPT_SORT_KEYS)
+            if item_key not in seen:
+                seen.add(item_key)
+                items.append(item)
+        return items
+    return '?'
+
+
+def fingerprint(operation: str, body: Any) -> tuple[str, str]:
+    """Возвращает короткий отпечаток запроса и его нормализованный вид."""
+    shape = orjson.dumps({operation: normalize(body)},
+                         option=orjson.OPT_SORT_KEYS).decode()
+    return hashlib.blake2b(shape.encode(), digest_size=8).hexdigest(), shape
+
+
+def caller() -> str:
+    """Метод сервиса, из которого пришёл запрос к Elastic.
+
+    Ищется по стеку вызовов: в корутине, пока она выполняется, стек
+    включает ожидающие её корутины. Для пачки BatchingSearchEngine
+    возвращается 'batch(...)' с источниками, записанными при постановке
+    запросов в пачку.
+    """
+    callers = batch_callers.get()
+    if callers is not None:
+        return f"batch({', '.join(callers)})"
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_ENGINE_MODULES):
+            owner = frame.f_locals.get('self')
+            name = frame.f_code.co_name
+            if owner is not None:
+                name = f'{type(owner).__name__}.{name}'
+            return f'{module}.{name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def source_size(result: Any) -> tuple[int, int]:
+    """Число найденных документов и размер их _source в байтах."""
+    if not isinstance(result, dict):
+        return 0, 0
+    if 'hits' in result:
+        docs = result['hits'].get('hits', [])
+    elif 'docs' in result:
+        docs = [doc for doc in result['docs'] if doc.get('found')]
+    elif '_source' in result:
+        docs = [result]
+    else:
+        return 0, 0
+    return len(docs), sum(len(orjson.dumps(doc.get('_source')))
+                          for doc in docs)
+
+
+class SlowQueryStats:
+    """Суммы по медленным запросам с одним отпечатком."""
+
+    def __init__(self, fingerprint: str, operation: str, index: str,
+                 query: str):
+        self.fingerprint = fingerprint
+        self.operation = operation
+        self.index = index
+        self.query = query
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.total_took_ms = 0
+        self.total_hits = 0
+        self.total_source_bytes = 0
+        self.callers: set[str] = set()
+
+
+class SlowQueryLog:
+    """Журнал медленных запросов к Elastic.
+
+    Запрос медленный, если время ответа или took от самого Elastic не
+    меньше threshold_ms. Каждый такой запрос пишется в лог с отпечатком,
+    и по отпечаткам копятся суммы, чтобы видеть, какие виды запросов
+    нагружают кластер. Суммы у каждого worker'а свои.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold_ms = threshold_ms
+        self.dropped = 0
+        self._stats: dict[str, SlowQueryStats] = {}
+
+    def is_slow(self, duration_ms: float, took_ms: Optional[int]) -> bool:
+        return self.threshold_ms > 0 and (
+            duration_ms >= self.threshold_ms
+            or (took_ms is not None and took_ms >= self.threshold_ms))
+
+    def record(self, operation: str, index: str, body: Any, result: Any,
+               duration_ms: float, took_ms: Optional[int],
+               source: str) -> None:
+        key, shape = fingerprint(operation, body)
+        hits, source_bytes = source_size(result)
+        logger.warning(
+            'Slow Elasticsearch %s on %s from %s: %.0f ms, took %s ms, '
+            '%d hits, %d bytes of _source, query %s %s', operation, index,
+            source, duration_ms, took_ms, hits, source_bytes, key, shape)
+
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= MAX_FINGERPRINTS:
+                self.dropped += 1
+                return
+            stats = self._stats[key] = SlowQueryStats(key, operation, index,
+                                                      shape)
+        stats.count += 1
+        stats.total_ms += duration_ms
+        stats.max_ms = max(stats.max_ms, duration_ms)
+        stats.total_took_ms += took_ms or 0
+        stats.total_hits += hits
+        stats.total_source_bytes += source_bytes
+        stats.callers.add(source)
+
+    def top(self, count: int) -> list[SlowQueryStats]:
+        """Отпечатки с наибольшим суммарным временем запросов."""
+        return sorted(self._stats.values(), key=lambda stats: stats.total_ms,
+                      reverse=True)[:count]
+
+    def clear(self) -> None:
+        self._stats.clear()
+        self.dropped = 0
+
+
+slow_queries = SlowQueryLog(settings.elastic_slow_query_ms)
@@ -0,0 +1,6 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Метрики-гейджи завершившегося worker'а больше не учитываются.
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,19 +1,34 @@
+import asyncio
 import logging.config
+import math
+from http import HTTPStatus
+from typing import Awaitable, Callable
 
 import httpx
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from redis.asyncio import Redis
+from redis.asyncio import BlockingConnectionPool, Redis
 
-from api.v1 import films, genres, persons
+from api.v1 import admin, films, genres, persons
 from core.logging import LOGGING
 from core.settings import settings
 from db import redis
+from db.access_stats import access_stats
+from db.cache import LocalCache, TieredRedisBackend
 from db.search_engine import elastic
+from db.search_engine.batching import BatchingSearchEngine
+from services.auth import get_auth_service
+from services.film import get_film_service
+from services.genre import get_genre_service
+from services.person import get_person_service
+from services.warmer import CacheWarmer
 from utils import http
-from utils.cache import request_key_builder
+from utils.cache import StaleResponseMiddleware, request_key_builder
+from utils.metrics import MetricsMiddleware, metrics_response
+from utils.profiling import ProfilingMiddleware
+from utils.resilience import DependencyUnavailableError, RetryBudgetMiddleware
+from utils.tracing import SpanExporter, TracingMiddleware
 
 logging.config.dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
@@ -24,22 +39,147 @@ app = FastAPI(
     openapi_url='/api/openapi.json',
     default_response_class=ORJSONResponse,
 )
+app.add_middleware(RetryBudgetMiddleware,
+                   retries=settings.retry_budget_per_request)
+app.add_middleware(StaleResponseMiddleware)
+if settings.tracing_export_file or settings.tracing_otlp_endpoint:
+    app.add_middleware(TracingMiddleware)
+if settings.admin_token or settings.profiling_sample_ratio:
+    app.add_middleware(ProfilingMiddleware)
+# Добавлен последним, поэтому снаружи и учитывает время всех остальных.
+app.add_middleware(MetricsMiddleware)
+
+
+async def warm_up(name: str, connections: int,
+                  request: Callable[[], Awaitable]) -> None:
+    """Открывает connections соединений пула одновременными запросами.
+
+    Запросы, пока не завершились, держат каждый своё соединение, и после
+    ответа они остаются в пуле. Ошибки только пишутся в лог: worker
+    стартует и без прогрева.
+    """
+    if connections <= 0:
+        return
+    results = await asyncio.gather(
+        *(request() for _ in range(connections)), return_exceptions=True)
+    errors = [result for result in results
+              if isinstance(result, Exception)]
+    if errors:
+        logger.warning('%d of %d %s connections failed to warm up: %r',
+                       len(errors), connections, name, errors[0])
 
 
 @app.on_event('startup')
 async def startup():
-    redis.redis = Redis.from_url(settings.redis_dsn)
-    FastAPICache.init(RedisBackend(redis.redis),
+    redis.redis = Redis(connection_pool=BlockingConnectionPool.from_url(
+        settings.redis_dsn,
+        max_connections=settings.redis_pool_max_connections,
+        timeout=settings.redis_timeout_seconds,
+        socket_timeout=settings.redis_timeout_seconds,
+        socket_connect_timeout=settings.redis_timeout_seconds,
+        socket_keepalive=True))
+    local_cache = LocalCache(
+        max_items=settings.cache_local_max_items,
+        max_bytes=settings.cache_local_max_bytes,
+        ttl=settings.cache_local_ttl_seconds,
+        namespace_ttl=settings.cache_local_namespace_ttl_seconds,
+    )
+    cache_backend = TieredRedisBackend(redis.redis, local_cache,
+                                       redis.dependency)
+    FastAPICache.init(cache_backend,
                       prefix='fastapi-cache',
                       key_builder=request_key_builder)
     elastic.search_engine = elastic.ElasticSearchEngine(
         hosts=[settings.elastic_dsn])
-    http.client = httpx.AsyncClient()
+    if settings.elastic_batch_window_ms:
+        elastic.search_engine = BatchingSearchEngine(
+            elastic.search_engine,
+            window=settings.elastic_batch_window_ms / 1000,
+            max_size=settings.elastic_batch_max_size)
+    http.client = httpx.AsyncClient(
+        timeout=settings.auth_timeout_seconds,
+        limits=httpx.Limits(
+            max_connections=settings.http_pool_max_connections,
+            max_keepalive_connections=settings.http_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_seconds))
+    # Первые запросы после старта не должны ждать установки соединений.
+    await asyncio.gather(
+        warm_up('redis', settings.redis_warmup_connections,
+                redis.redis.ping),
+        warm_up('elasticsearch', settings.elastic_warmup_connections,
+                elastic.search_engine.ping),
+        warm_up('auth', settings.http_warmup_connections
+                if settings.auth_url else 0,
+                lambda: http.client.head(settings.auth_url)),
+    )
+
+    # Тот же объект, что отдаёт зависимость: FastAPI вызывает её
+    # с именованным аргументом.
+    genre_service = get_genre_service(search_engine=elastic.search_engine)
+    try:
+        await genre_service.refresh()
+    except Exception:
+        logger.warning('Genre snapshot is not loaded at startup',
+                       exc_info=True)
+    cache_backend.add_invalidation_listener(
+        genre_service.on_cache_invalidation)
+    app.state.background_tasks = [
+        asyncio.create_task(cache_backend.listen_invalidations()),
+        asyncio.create_task(genre_service.refresh_periodically(
+            settings.genre_snapshot_refresh_seconds)),
+    ]
+    app.state.background_tasks.append(asyncio.create_task(
+        access_stats.flush_periodically(
+            redis.redis, settings.access_stats_flush_seconds)))
+    if settings.cache_warm_top:
+        warmer = CacheWarmer(
+            app, redis.redis,
+            get_film_service(search_engine=elastic.search_engine),
+            get_person_service(search_engine=elastic.search_engine))
+        app.state.background_tasks.append(asyncio.create_task(
+            warmer.run_periodically(settings.cache_warm_interval_seconds)))
+    app.state.span_exporter = None
+    if settings.tracing_export_file or settings.tracing_otlp_endpoint:
+        app.state.span_exporter = SpanExporter(
+            http.client, file=settings.tracing_export_file,
+            endpoint=settings.tracing_otlp_endpoint)
+        app.state.background_tasks.append(asyncio.create_task(
+            app.state.span_exporter.export_periodically(
+                settings.tracing_export_seconds)))
+    verifier = get_auth_service(http_client=http.client,
+                                redis=redis.redis).verifier
+    if verifier is not None:
+        app.state.background_tasks.append(asyncio.create_task(
+            verifier.refresh_periodically(
+                settings.auth_jwks_refresh_seconds)))
+
+
+@app.exception_handler(DependencyUnavailableError)
+async def dependency_unavailable_handler(
+    request: Request, exc: DependencyUnavailableError
+) -> ORJSONResponse:
+    headers = {}
+    if exc.retry_after:
+        headers['Retry-After'] = str(math.ceil(exc.retry_after))
+    return ORJSONResponse(status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                          content={'detail': str(exc)}, headers=headers)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics() -> Response:
+    return metrics_response()
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    await redis.redis.close()
+    for task in app.state.background_tasks:
+        task.cancel()
+    if app.state.span_exporter is not None:
+        try:
+            await app.state.span_exporter.export()
+        except Exception:
+            logger.warning('Span export failed', exc_info=True)
+    await redis.redis.close(close_connection_pool=True)
     await elastic.search_engine.close()
     await http.client.aclose()
 
@@ -47,3 +187,4 @@ async def shutdown():
 app.include_router(films.router, prefix='/api/v1/films', tags=['Фильмы'])
 app.include_router(persons.router, prefix='/api/v1/persons', tags=['Персоны'])
 app.include_router(genres.router, prefix='/api/v1/genres', tags=['Жанры'])
+app.include_router(admin.router, prefix='/api/v1/admin', tags=['Служебное'])
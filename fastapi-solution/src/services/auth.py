@@ -1,19 +1,182 @@
+import asyncio
 import logging
+import time
 from functools import lru_cache
+from hashlib import sha256
+from typing import Any, Optional
 
 import httpx
+import jwt
+import orjson
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
 from core.settings import settings
+from db import redis as redis_db
+from db.cache import LocalCache
+from db.redis import get_redis
 from utils.http import get_http_client
+from utils.metrics import AUTH_DURATION
+from utils.resilience import Dependency, DependencyUnavailableError
+from utils.singleflight import SingleFlight
+from utils.tracing import KIND_CLIENT, span
 
 logger = logging.getLogger(__name__)
 
+AUTH_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Не чаще этого перечитывать ключи из-за токена с незнакомым kid.
+JWKS_MIN_REFRESH_SECONDS = 30
+
+
+def is_auth_failure(error: BaseException) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return (error.response.status_code
+                >= status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return isinstance(error, httpx.TransportError)
+
+
+dependency = Dependency('auth', is_auth_failure)
+
+
+class TokenVerifier:
+    """Проверяет подпись, срок действия и роли JWT без запроса к сервису
+    авторизации.
+
+    Открытые ключи берутся из JWKS сервиса авторизации или из файла
+    с JWKS или PEM. Если заданы settings.auth_jwt_issuer или
+    settings.auth_jwt_audience, токен без них или с другими значениями
+    отклоняется, даже если подписан известным ключом. Токены, которые
+    нельзя решить локально — с незнакомым
+    ключом, без нужной роли или не JWT вовсе, — verify не решает: роль
+    могла появиться после выдачи токена, и это знает только сервис.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient,
+                 jwks_url: Optional[str] = None,
+                 jwks_file: Optional[str] = None):
+        self.http_client = http_client
+        self.jwks_url = jwks_url
+        self.jwks_file = jwks_file
+        self._keys: dict[Optional[str], Any] = {}
+        self._loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def load_keys(self) -> None:
+        if self.jwks_file:
+            with open(self.jwks_file) as file:
+                data = file.read()
+        else:
+            response = await self.http_client.get(self.jwks_url)
+            response.raise_for_status()
+            data = response.text
+
+        if data.lstrip().startswith('-----BEGIN'):
+            keys = {None: data}
+        else:
+            keys = {key.key_id: key.key
+                    for key in jwt.PyJWKSet.from_json(data).keys}
+        self._keys = keys
+        self._loaded_at = time.monotonic()
+        logger.debug('Loaded %d token signing keys', len(keys))
+
+    async def refresh_periodically(self, interval: float) -> None:
+        """Перечитывает ключи каждые interval секунд до отмены задачи."""
+        while True:
+            try:
+                await self.load_keys()
+            except Exception:
+                logger.warning('Token signing keys are not loaded',
+                               exc_info=True)
+            await asyncio.sleep(interval)
+
+    def verify(self, token: str, allow_roles: Optional[list[str]]
+               ) -> Optional[tuple[int, str]]:
+        """Возвращает решение как у сервиса авторизации или None."""
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except jwt.InvalidTokenError:
+            return None
+        key = self._keys.get(kid)
+        if key is None and kid is None and len(self._keys) == 1:
+            key = next(iter(self._keys.values()))
+        if key is None:
+            # Ключ могли сменить после последней загрузки.
+            self._refresh_soon()
+            return None
+
+        required = ['exp']
+        if settings.auth_jwt_issuer:
+            required.append('iss')
+        if settings.auth_jwt_audience:
+            required.append('aud')
+        try:
+            claims = jwt.decode(
+                token, key, algorithms=settings.auth_jwt_algorithms,
+                audience=settings.auth_jwt_audience,
+                issuer=settings.auth_jwt_issuer,
+                options={'require': required,
+                         'verify_aud': bool(settings.auth_jwt_audience)})
+        except jwt.ExpiredSignatureError:
+            return status.HTTP_401_UNAUTHORIZED, 'Token expired'
+        except (jwt.InvalidSignatureError, jwt.InvalidIssuerError,
+                jwt.InvalidAudienceError):
+            return status.HTTP_401_UNAUTHORIZED, 'Invalid token'
+        except jwt.MissingRequiredClaimError as e:
+            if e.claim in ('iss', 'aud'):
+                return status.HTTP_401_UNAUTHORIZED, 'Invalid token'
+            return None
+        except jwt.InvalidTokenError:
+            return None
+
+        roles = claims.get(settings.auth_jwt_roles_claim) or []
+        if allow_roles and not set(allow_roles) & set(roles):
+            return None
+        return status.HTTP_204_NO_CONTENT, ''
+
+    def _refresh_soon(self) -> None:
+        if (self._refresh_task is not None
+                or time.monotonic() - self._loaded_at
+                < JWKS_MIN_REFRESH_SECONDS):
+            return
+
+        async def refresh() -> None:
+            try:
+                await self.load_keys()
+            except Exception:
+                logger.warning('Token signing keys are not loaded',
+                               exc_info=True)
+            finally:
+                self._refresh_task = None
+
+        self._refresh_task = asyncio.create_task(refresh())
+
 
 class AuthService:
-    def __init__(self, http_client: httpx.AsyncClient):
+    """Проверяет доступ через сервис авторизации и кэширует решения.
+
+    Решение хранится по хэшу токена и ролей: разрешение — недолго,
+    чтобы отозванный токен скоро перестал работать, отказ — ещё меньше.
+    Кэш есть в памяти worker'а и, если задан redis, общий в Redis.
+    Одновременные проверки одного токена делают один запрос.
+
+    Если задан verifier, токены Bearer сначала проверяются локально,
+    и сервис авторизации спрашивается, только если verifier не решил.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient,
+                 redis: Optional[Redis] = None,
+                 verifier: Optional[TokenVerifier] = None):
         self.http_client = http_client
+        self.redis = redis
+        self.verifier = verifier
+        self.decisions = LocalCache(
+            max_items=settings.auth_cache_max_items,
+            max_bytes=AUTH_CACHE_MAX_BYTES,
+            ttl=settings.auth_cache_allow_seconds,
+        )
+        self.single_flight = SingleFlight()
 
     async def check_access(
         self, creds: HTTPAuthorizationCredentials,
@@ -26,24 +189,132 @@ class AuthService:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail='Not authenticated')
 
+        with span('auth.check_access') as check_span:
+            decision = None
+            if (self.verifier is not None
+                    and creds.scheme.lower() == 'bearer'):
+                decision = self.verifier.verify(creds.credentials,
+                                                allow_roles)
+                check_span.set(**{'auth.source': 'token'})
+            key = self._decision_key(creds, allow_roles)
+            if decision is None:
+                decision = await self._get_cached_decision(key)
+                check_span.set(**{'auth.source': 'cache'})
+            if decision is None:
+                decision = await self.single_flight.do(
+                    key,
+                    lambda: self._request_decision(key, creds, allow_roles))
+                check_span.set(**{'auth.source': 'service'})
+
+        status_code, detail = decision
+        if status_code != status.HTTP_204_NO_CONTENT:
+            raise HTTPException(status_code=status_code, detail=detail)
+
+    def _decision_key(self, creds: HTTPAuthorizationCredentials,
+                      allow_roles: Optional[list[str]]) -> str:
+        token_key = '\n'.join([creds.scheme, creds.credentials,
+                               *sorted(allow_roles or [])])
+        return f'fastapi-cache:auth:{sha256(token_key.encode()).hexdigest()}'
+
+    async def _get_cached_decision(self, key: str
+                                   ) -> Optional[tuple[int, str]]:
+        cached = self.decisions.get(key)
+        if cached is not None:
+            return tuple(orjson.loads(cached[1]))
+        if self.redis is None:
+            return None
+
+        try:
+            ttl, value = await redis_db.dependency.call(
+                self._get_stored_decision, key)
+        except (RedisError, DependencyUnavailableError):
+            logger.warning('Error retrieving auth decision', exc_info=True)
+            return None
+        if value is None:
+            return None
+        self.decisions.set(key, value, ttl)
+        return tuple(orjson.loads(value))
+
+    async def _get_stored_decision(self, key: str
+                                   ) -> tuple[int, Optional[bytes]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            return await pipe.ttl(key).get(key).execute()
+
+    async def _request_decision(
+        self, key: str, creds: HTTPAuthorizationCredentials,
+        allow_roles: Optional[list[str]]
+    ) -> tuple[int, str]:
+        try:
+            response = await dependency.call(self._check_access_request,
+                                             creds, allow_roles)
+        except DependencyUnavailableError as e:
+            if not isinstance(e.__cause__, httpx.HTTPStatusError):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail='Auth service unavailable')
+            response = e.__cause__.response
+
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            decision = (response.status_code, '')
+            expire = settings.auth_cache_allow_seconds
+        else:
+            decision = (response.status_code,
+                        response.json().get('detail', ''))
+            expire = settings.auth_cache_deny_seconds
+        # Ошибки самого сервиса авторизации — не решение, их не кэшируем.
+        if response.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+            await self._store_decision(key, decision, expire)
+        return decision
+
+    async def _check_access_request(
+        self, creds: HTTPAuthorizationCredentials,
+        allow_roles: Optional[list[str]]
+    ) -> httpx.Response:
+        start = time.perf_counter()
         try:
-            response = await self.http_client.get(
-                f'{settings.auth_url}/api/v1/check_access',
-                params={'allow_roles': allow_roles},
-                headers={
-                    'Authorization': f'{creds.scheme} {creds.credentials}'
-                }
-            )
-            if response.status_code != status.HTTP_204_NO_CONTENT:
-                raise HTTPException(status_code=response.status_code,
-                                    detail=response.json().get('detail', ''))
+            with span('auth.request', KIND_CLIENT):
+                response = await self.http_client.get(
+                    f'{settings.auth_url}/api/v1/check_access',
+                    params={'allow_roles': allow_roles},
+                    headers={
+                        'Authorization': f'{creds.scheme} {creds.credentials}'
+                    },
+                    timeout=settings.auth_timeout_seconds,
+                )
         except httpx.HTTPError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail='Auth service unavailable')
+            AUTH_DURATION.labels('error').observe(time.perf_counter() - start)
+            raise
+        AUTH_DURATION.labels(response.status_code).observe(
+            time.perf_counter() - start)
+        if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            # Ошибка сервера — отказ, который стоит повторить.
+            response.raise_for_status()
+        return response
+
+    async def _store_decision(self, key: str, decision: tuple[int, str],
+                              expire: int) -> None:
+        if expire <= 0:
+            return
+        value = orjson.dumps(decision)
+        self.decisions.set(key, value, expire)
+        if self.redis is None:
+            return
+        try:
+            await redis_db.dependency.call(self.redis.set, key, value,
+                                           ex=expire)
+        except (RedisError, DependencyUnavailableError):
+            logger.warning('Error setting auth decision', exc_info=True)
 
 
 @lru_cache()
 def get_auth_service(
-    http_client: httpx.AsyncClient = Depends(get_http_client)
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    redis: Redis = Depends(get_redis),
 ) -> AuthService:
-    return AuthService(http_client)
+    verifier = None
+    if settings.auth_jwks_url or settings.auth_jwks_file:
+        verifier = TokenVerifier(http_client, settings.auth_jwks_url,
+                                 settings.auth_jwks_file)
+    return AuthService(http_client,
+                       redis if settings.auth_cache_redis else None,
+                       verifier)
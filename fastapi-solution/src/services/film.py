@@ -4,7 +4,6 @@ from typing import Literal, Optional
 from uuid import UUID
 
 from fastapi import Depends
-from fastapi_cache.decorator import cache
 
 from core.settings import settings
 from db.search_engine.base import SearchEngine
@@ -12,25 +11,49 @@ from db.search_engine.elastic import get_elastic_search_engine
 from models.film import ESFilm, ESFilmFull, ESFilmPerson
 from models.genre import ESGenre
 from models.person import ROLES
-from utils.cache import class_method_key_builder, get_model_coder
+from utils.cache import (cache, class_method_key_builder, get_many_cached,
+                         get_model_coder)
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
+# Поля ESFilm, которые списки запрашивают по умолчанию.
+FILM_FIELDS = list(ESFilm.__fields__.keys())
+
 
 class FilmService:
     def __init__(self, search_engine: SearchEngine):
         self.search_engine = search_engine
 
     @cache(expire=settings.redis_cache_expire_seconds,
+           namespace='film',
            key_builder=class_method_key_builder,
            coder=get_model_coder(ESFilmFull))
     async def get_by_id(self, film_id: UUID) -> Optional[ESFilmFull]:
         film = await self.search_engine.get_by_id(
             'movies', film_id, fields=list(ESFilmFull.__fields__.keys()))
-
         if not film:
             return None
+        with span('film.build'):
+            return self._build_film(film)
+
+    async def get_many(self, film_ids: list[UUID]) -> list[ESFilmFull]:
+        """Возвращает найденные фильмы, используя кэш get_by_id."""
+        films = await get_many_cached(
+            FilmService.get_by_id, self, film_ids, self._load_many,
+            coder=get_model_coder(ESFilmFull),
+            expire=settings.redis_cache_expire_seconds, namespace='film')
+        return [film for film in films if film]
 
+    async def _load_many(self, film_ids: list[UUID]
+                         ) -> list[Optional[ESFilmFull]]:
+        films = await self.search_engine.get_many(
+            'movies', film_ids, fields=list(ESFilmFull.__fields__.keys()))
+        with span('film.build', **{'films': len(films)}):
+            return [self._build_film(film) if film else None
+                    for film in films]
+
+    def _build_film(self, film: dict) -> ESFilmFull:
         flat_fields = ['id', 'title', 'imdb_rating', 'description']
         nested_fields = {
             'genres': ESGenre,
@@ -44,15 +67,40 @@ class FilmService:
             },
         )
 
-    async def search(self, query: str, page_number: int, page_size: int
-                     ) -> list[ESFilm]:
-        films = await self.search_engine.get_list(
-            'movies', fields=list(ESFilm.__fields__.keys()),
+    async def search(self, query: str, page_number: int, page_size: int,
+                     fields: Optional[list[str]] = None) -> list[dict]:
+        """Возвращает _source найденных фильмов без перевода в модели."""
+        return await self.search_engine.get_list(
+            'movies', fields=fields or FILM_FIELDS,
             search_fields={'title': query},
             filter_fields={}, sort_params=[],
             page_number=page_number, page_size=page_size
         )
-        return [ESFilm(**film) for film in films]
+
+    async def search_page(self, query: str, cursor: Optional[str],
+                          page_size: int, fields: Optional[list[str]] = None
+                          ) -> tuple[list[dict], Optional[str]]:
+        return await self.search_engine.get_list_after(
+            'movies', fields=fields or FILM_FIELDS,
+            search_fields={'title': query},
+            cursor=cursor, page_size=page_size
+        )
+
+    async def list_page(self,
+                        genre_id: Optional[UUID],
+                        sort_params: list[Literal[
+                            'imdb_rating', '-imdb_rating',
+                            'title', '-title']
+                        ],
+                        cursor: Optional[str], page_size: int,
+                        fields: Optional[list[str]] = None
+                        ) -> tuple[list[dict], Optional[str]]:
+        return await self.search_engine.get_list_after(
+            'movies', fields=fields or FILM_FIELDS,
+            filter_fields=self._genre_filter(genre_id),
+            sort_params=sort_params,
+            cursor=cursor, page_size=page_size
+        )
 
     async def list(self,
                    genre_id: Optional[UUID],
@@ -60,19 +108,18 @@ class FilmService:
                        'imdb_rating', '-imdb_rating',
                        'title', '-title']
                    ],
-                   page_number: int, page_size: int) -> list[ESFilm]:
-        filter_fields = {}
-        if genre_id:
-            filter_fields['genres'] = [str(genre_id)]
-
-        films = await self.search_engine.get_list(
-            'movies', fields=list(ESFilm.__fields__.keys()),
+                   page_number: int, page_size: int,
+                   fields: Optional[list[str]] = None) -> list[dict]:
+        return await self.search_engine.get_list(
+            'movies', fields=fields or FILM_FIELDS,
             search_fields={},
-            filter_fields=filter_fields,
+            filter_fields=self._genre_filter(genre_id),
             sort_params=sort_params,
             page_number=page_number, page_size=page_size
         )
-        return [ESFilm(**film) for film in films]
+
+    def _genre_filter(self, genre_id: Optional[UUID]) -> dict:
+        return {'genres': [str(genre_id)]} if genre_id else {}
 
 
 @lru_cache()
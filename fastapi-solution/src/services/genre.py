@@ -1,5 +1,9 @@
+import asyncio
+import logging
 from functools import lru_cache
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+from uuid import UUID
 
 from fastapi import Depends
 
@@ -7,20 +11,124 @@ from db.search_engine.base import SearchEngine
 from db.search_engine.elastic import get_elastic_search_engine
 from models.genre import ESGenre
 
+logger = logging.getLogger(__name__)
+
+
+class GenreSnapshot(NamedTuple):
+    """Неизменяемый снимок всех жанров."""
+    genres: tuple[ESGenre, ...]
+    by_id: Mapping[str, ESGenre]
+
 
 class GenreService:
+    """Отдаёт жанры из снимка в памяти worker'а без обращения к ES и Redis.
+
+    Снимок загружается при старте, перечитывается по расписанию и при сбросе
+    кэша и подменяется целиком, поэтому читатели всегда видят согласованный
+    набор жанров.
+    """
+
     def __init__(self, search_engine: SearchEngine):
         self.search_engine = search_engine
+        self._snapshot: Optional[GenreSnapshot] = None
+        self._current_refresh: Optional[asyncio.Task] = None
+        self._next_refresh: Optional[asyncio.Task] = None
 
-    async def get_by_id(self, genre_id: str) -> Optional[ESGenre]:
-        genre = await self.search_engine.get_by_id(
-            'genres', genre_id, list(ESGenre.__fields__.keys()))
-        return ESGenre(**genre) if genre else None
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    async def get_snapshot(self) -> GenreSnapshot:
+        """Возвращает снимок, загружая его, если при старте это не удалось."""
+        if self._snapshot is None:
+            await self.refresh()
+        return self._snapshot
+
+    async def get_by_id(self, genre_id: UUID | str) -> Optional[ESGenre]:
+        snapshot = await self.get_snapshot()
+        return snapshot.by_id.get(str(genre_id))
+
+    async def get_many(self, genre_ids: list[UUID]) -> list[ESGenre]:
+        snapshot = await self.get_snapshot()
+        return [snapshot.by_id[str(id)] for id in genre_ids
+                if str(id) in snapshot.by_id]
 
     async def get_all(self) -> list[ESGenre]:
-        genres = await self.search_engine.get_list(
-            'genres', fields=list(ESGenre.__fields__.keys()))
-        return [ESGenre(**genre) for genre in genres]
+        snapshot = await self.get_snapshot()
+        return list(snapshot.genres)
+
+    async def refresh(self) -> None:
+        """Перечитывает снимок.
+
+        Загрузка, начатая до вызова, могла прочитать устаревшие данные,
+        поэтому вызов ждёт следующую загрузку, общую для всех вызовов,
+        пришедших во время текущей.
+        """
+        if self._next_refresh is None:
+            self._next_refresh = asyncio.create_task(
+                self._refresh_after(self._current_refresh))
+            self._next_refresh.add_done_callback(
+                lambda t: t.cancelled() or t.exception())
+        await asyncio.shield(self._next_refresh)
+
+    async def _refresh_after(self, previous: Optional[asyncio.Task]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        self._current_refresh, self._next_refresh = self._next_refresh, None
+        try:
+            await self._load()
+        finally:
+            self._current_refresh = None
+
+    async def _load(self) -> None:
+        genres = []
+        cursor = None
+        while True:
+            page, cursor = await self.search_engine.get_list_after(
+                'genres', fields=list(ESGenre.__fields__.keys()),
+                cursor=cursor)
+            genres.extend(ESGenre(**genre) for genre in page)
+            if cursor is None:
+                break
+
+        self._snapshot = GenreSnapshot(
+            genres=tuple(genres),
+            by_id=MappingProxyType({str(genre.id): genre
+                                    for genre in genres}),
+        )
+        logger.debug('Genre snapshot loaded: %d genres', len(genres))
+
+    async def refresh_periodically(self, interval: float) -> None:
+        """Перечитывает снимок каждые interval секунд до отмены задачи."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning('Genre snapshot refresh failed', exc_info=True)
+
+    async def on_cache_invalidation(self, tag_keys: list[str]) -> None:
+        """Перечитывает снимок при сбросе кэша по id жанров или всего кэша.
+
+        Теги не различают жанры, фильмы и персоны: id, которых нет
+        в снимке, проверяются одним _mget в индексе жанров, чтобы заметить
+        новые жанры. Сброс только фильмов и персон снимок не перечитывает.
+
+        Другие worker'ы узнают о сбросе по pub/sub и перечитывают снимок
+        в фоне, поэтому сразу после ответа ручки сброса они ещё какое-то
+        время, обычно пока идёт загрузка из ES, отдают прежний снимок.
+        """
+        if tag_keys and not await self._has_genres(tag_keys):
+            return
+        await self.refresh()
+
+    async def _has_genres(self, tag_keys: list[str]) -> bool:
+        ids = {tag_key.rsplit(':', 1)[-1] for tag_key in tag_keys}
+        if self._snapshot is None or not ids.isdisjoint(self._snapshot.by_id):
+            return True
+        docs = await self.search_engine.get_many('genres', sorted(ids),
+                                                 ['id'])
+        return any(doc is not None for doc in docs)
 
 
 @lru_cache()
@@ -1,14 +1,19 @@
 import logging
+from collections import defaultdict
 from functools import lru_cache
-from typing import Optional
+from typing import Any, Optional
 from uuid import UUID
 
 from fastapi import Depends
 
+from core.settings import settings
 from db.search_engine.base import SearchEngine
 from db.search_engine.elastic import get_elastic_search_engine
 from models.film import ESFilm
-from models.person import ROLES, ESPerson, ESPersonFilm
+from models.person import ROLES, ESPerson
+from utils.cache import (cache, class_method_key_builder, get_many_cached,
+                         get_model_coder)
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +22,10 @@ class PersonService:
     def __init__(self, search_engine: SearchEngine):
         self.search_engine = search_engine
 
+    @cache(expire=settings.redis_cache_expire_seconds,
+           namespace='person',
+           key_builder=class_method_key_builder,
+           coder=get_model_coder(ESPerson))
     async def get_by_id(self, person_id: UUID) -> Optional[ESPerson]:
         person = await self.search_engine.get_by_id(
             'persons', person_id, fields=['id', 'full_name'])
@@ -24,61 +33,117 @@ class PersonService:
         if not person:
             return None
 
-        films = await self.search_engine.get_list(
-            'movies', fields=['id', 'actors', 'writers', 'directors'],
-            search_fields={},
+        films = await self.search_engine.get_list_matched(
+            'movies', fields=['id'],
             filter_fields={f'{role}s': [person_id] for role in ROLES}
         )
-        return ESPerson(films=self._get_person_films(person_id, films),
-                        **person)
-
-    async def search(self, query: str, page_number: int, page_size: int
-                     ) -> list[ESPerson]:
+        with span('person.build'):
+            return ESPerson(
+                films=self._get_person_films(films).get(str(person_id), []),
+                **person
+            )
+
+    async def get_many(self, person_ids: list[UUID]) -> list[ESPerson]:
+        """Возвращает найденные персоны, используя кэш get_by_id."""
+        persons = await get_many_cached(
+            PersonService.get_by_id, self, person_ids, self._load_many,
+            coder=get_model_coder(ESPerson),
+            expire=settings.redis_cache_expire_seconds, namespace='person')
+        return [person for person in persons if person]
+
+    async def _load_many(self, person_ids: list[UUID]
+                         ) -> list[Optional[ESPerson]]:
+        persons = await self.search_engine.get_many(
+            'persons', person_ids, fields=['id', 'full_name'])
+        found = await self._with_films([person for person in persons
+                                        if person])
+        with span('person.build', **{'persons': len(found)}):
+            found_by_id = {str(person['id']): ESPerson(**person)
+                           for person in found}
+        return [found_by_id.get(str(id)) for id in person_ids]
+
+    async def search(self, query: str, page_number: int, page_size: int,
+                     fields: Optional[list[str]] = None) -> list[dict]:
+        """Возвращает найденные персоны в формате ESPerson без перевода
+        в модели.
+        """
         persons = await self.search_engine.get_list(
-            'persons', fields=['id', 'full_name'],
+            'persons', fields=self._person_source(fields),
             search_fields={'full_name': query},
             filter_fields={}, sort_params=[],
             page_number=page_number, page_size=page_size
         )
+        return await self._with_films(persons, fields)
 
-        person_ids = [person['id'] for person in persons]
-        films = await self.search_engine.get_list(
-            'movies', fields=['id', 'actors', 'writers', 'directors'],
-            search_fields={},
-            filter_fields={f'{role}s': person_ids for role in ROLES}
+    async def search_page(self, query: str, cursor: Optional[str],
+                          page_size: int, fields: Optional[list[str]] = None
+                          ) -> tuple[list[dict], Optional[str]]:
+        persons, next_cursor = await self.search_engine.get_list_after(
+            'persons', fields=self._person_source(fields),
+            search_fields={'full_name': query},
+            cursor=cursor, page_size=page_size
         )
-
-        return [
-            ESPerson(films=self._get_person_films(person['id'], films),
-                     **person)
-            for person in persons
-        ]
-
-    async def list_films(self, person_id: UUID) -> list[ESFilm]:
-        films = await self.search_engine.get_list(
-            'movies', fields=['id', 'title', 'imdb_rating'],
+        return await self._with_films(persons, fields), next_cursor
+
+    def _person_source(self, fields: Optional[list[str]]) -> list[str]:
+        """Поля индекса persons для выбранных полей ESPerson.
+
+        Фильмов в индексе нет, а id нужен, чтобы их найти.
+        """
+        if fields is None:
+            return ['id', 'full_name']
+        if 'films' in fields:
+            fields = ['id', *fields]
+        return list(dict.fromkeys(field for field in fields
+                                  if field != 'films'))
+
+    async def _with_films(self, persons: list,
+                          fields: Optional[list[str]] = None
+                          ) -> list[dict]:
+        if not persons or (fields is not None and 'films' not in fields):
+            return persons
+
+        films = await self.search_engine.get_list_matched(
+            'movies', fields=['id'],
+            filter_fields={f'{role}s': [person['id'] for person in persons]
+                           for role in ROLES}
+        )
+        with span('person.join_films', **{'persons': len(persons),
+                                          'films': len(films)}):
+            person_films = self._get_person_films(films)
+            return [
+                {**person, 'films': person_films.get(str(person['id']), [])}
+                for person in persons
+            ]
+
+    async def list_films(self, person_id: UUID,
+                         fields: Optional[list[str]] = None) -> list[dict]:
+        return await self.search_engine.get_list(
+            'movies', fields=fields or list(ESFilm.__fields__.keys()),
             search_fields={},
             filter_fields={f'{role}s': [person_id] for role in ROLES}
         )
 
-        return [ESFilm(**film) for film in films]
-
-    def _get_person_films(self, person_id: UUID, films: list
-                          ) -> list[ESPersonFilm]:
-        return [
-            ESPersonFilm(id=film['id'], roles=roles)
-            for film in films
-            if (roles := self._get_person_roles(person_id, film))
-        ]
-
-    def _get_person_roles(self, person_id: UUID, film) -> list[str]:
-        return [
-            role for role in ROLES
-            if str(person_id) in self._get_film_role_person_ids(film, role)
-        ]
-
-    def _get_film_role_person_ids(self, film, role: str) -> list[UUID]:
-        return [p['id'] for p in film.get(f'{role}s', [])]
+    def _get_person_films(self, films: list[tuple[Any, list[str]]]
+                          ) -> dict[str, list[dict]]:
+        """Строит по совпадениям '{role}s:{person_id}' фильмы каждой персоны
+        за один проход.
+        """
+        person_roles = defaultdict(lambda: defaultdict(set))
+        for film, matched in films:
+            for name in matched:
+                field, _, person_id = name.partition(':')
+                person_roles[person_id][film['id']].add(
+                    field.removesuffix('s'))
+
+        return {
+            person_id: [
+                {'id': film_id,
+                 'roles': [role for role in ROLES if role in roles]}
+                for film_id, roles in film_roles.items()
+            ]
+            for person_id, film_roles in person_roles.items()
+        }
 
 
 @lru_cache()
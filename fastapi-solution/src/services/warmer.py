@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Awaitable, Iterable
+from uuid import UUID
+
+import httpx
+from fastapi import FastAPI
+from fastapi_cache import FastAPICache
+from redis.asyncio import Redis
+
+from core.settings import settings
+from db.access_stats import access_stats
+from services.film import FilmService
+from services.person import PersonService
+from utils.cache import refreshing
+
+logger = logging.getLogger(__name__)
+
+WARM_LOCK_KEY = 'fastapi-cache:warm'
+# Какие обращения учитываются и прогреваются.
+WARM_KINDS = ('film_list', 'film_details', 'person_details')
+
+
+def _uuids(members: Iterable[str]) -> list[UUID]:
+    ids = []
+    for member in members:
+        try:
+            ids.append(UUID(member))
+        except ValueError:
+            pass
+    return ids
+
+
+class CacheWarmer:
+    """Заранее загружает в кэш то, что чаще всего запрашивают.
+
+    Берёт из access_stats самые частые обращения и загружает записи,
+    которые не доживут свежими до следующего прогрева: фильмы и персоны —
+    пачками через get_many, списки фильмов — запросом к самому приложению,
+    чтобы ключ и запись были те же, что у клиентов. Одновременно идёт
+    не больше settings.cache_warm_concurrency загрузок.
+
+    Прогревает один worker: тот, кто взял блокировку в Redis на цикл.
+    Жанры не прогреваются: они и так отдаются из снимка в памяти.
+    """
+
+    def __init__(self, app: FastAPI, redis: Redis,
+                 film_service: FilmService, person_service: PersonService):
+        self.app = app
+        self.redis = redis
+        self.film_service = film_service
+        self.person_service = person_service
+
+    async def run_periodically(self, interval: float) -> None:
+        """Прогревает кэш сразу и затем каждые interval секунд до отмены."""
+        while True:
+            try:
+                await self.warm(interval)
+            except Exception:
+                logger.warning('Cache warm-up failed', exc_info=True)
+            await asyncio.sleep(interval)
+
+    async def warm(self, interval: float) -> None:
+        backend = FastAPICache.get_backend()
+        if not await backend.acquire_lock(WARM_LOCK_KEY, int(interval)):
+            return
+
+        await access_stats.decay(self.redis, WARM_KINDS,
+                                 settings.access_stats_decay,
+                                 settings.access_stats_max_members)
+        count = settings.cache_warm_top
+        film_ids, person_ids, film_lists = await asyncio.gather(*(
+            access_stats.top(self.redis, kind, count)
+            for kind in ('film_details', 'person_details', 'film_list')))
+        film_ids, person_ids = _uuids(film_ids), _uuids(person_ids)
+
+        semaphore = asyncio.Semaphore(settings.cache_warm_concurrency)
+
+        async def limited(load: Awaitable) -> None:
+            async with semaphore:
+                try:
+                    await load
+                except Exception:
+                    logger.warning('Cache warm-up load failed',
+                                   exc_info=True)
+
+        size = settings.bulk_max_ids
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://warmer') as client:
+            with refreshing(int(interval)):
+                await asyncio.gather(
+                    *(limited(self.film_service.get_many(
+                        film_ids[i:i + size]))
+                      for i in range(0, len(film_ids), size)),
+                    *(limited(self.person_service.get_many(
+                        person_ids[i:i + size]))
+                      for i in range(0, len(person_ids), size)),
+                    *(limited(client.get(f'/api/v1/films?{query}'))
+                      for query in film_lists),
+                )
+        logger.debug('Warmed %d films, %d persons, %d film lists',
+                     len(film_ids), len(person_ids), len(film_lists))
@@ -1,12 +1,113 @@
+import asyncio
+import inspect
 import logging
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
 from hashlib import md5
-from typing import Any, Callable, Optional
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Optional, Type
+from uuid import UUID
 
+import orjson
 from fastapi import Request, Response
 from fastapi_cache import Coder, FastAPICache
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+from core.settings import settings
+from utils.metrics import CACHE_REQUESTS
+from utils.resilience import DependencyUnavailableError
+from utils.singleflight import SingleFlight
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
+single_flight = SingleFlight()
+
+# Ответ, который обработчик вернул сам, хранится как префикс, ETag и тело.
+# С нулевого байта не начинается ни одно значение JSON.
+RESPONSE_PREFIX = b'\x00etag:'
+ETAG_LENGTH = 32
+# Сжатое значение любого формата.
+COMPRESSED_PREFIX = b'\x00z'
+
+# Задачи фонового обновления устаревших записей и время, до которого
+# worker не пытается повторно обновить ключ.
+_refresh_tasks: set[asyncio.Task] = set()
+_refresh_attempts: dict[str, float] = {}
+
+# Заголовки ответа, собранного из записей кэша, которые не удалось обновить.
+STALE_HEADERS = [(b'warning', b'111 - "Revalidation Failed"'),
+                 (b'x-cache', b'STALE')]
+
+
+class _StaleState:
+    stale = False
+
+
+_stale_state: ContextVar[Optional[_StaleState]] = ContextVar(
+    'stale_state', default=None)
+
+
+_refresh_min_ttl: ContextVar[Optional[int]] = ContextVar(
+    'refresh_min_ttl', default=None)
+
+
+@contextmanager
+def refreshing(min_ttl: int) -> Iterator[None]:
+    """Внутри блока записи cache и get_many_cached, которые останутся
+    свежими меньше min_ttl секунд, загружаются заново, как промахи.
+    """
+    token = _refresh_min_ttl.set(min_ttl)
+    try:
+        yield
+    finally:
+        _refresh_min_ttl.reset(token)
+
+
+def is_refreshing() -> bool:
+    return _refresh_min_ttl.get() is not None
+
+
+def _expires_soon(fresh_ttl: int) -> bool:
+    min_ttl = _refresh_min_ttl.get()
+    return min_ttl is not None and fresh_ttl < min_ttl
+
+
+def _mark_stale() -> None:
+    state = _stale_state.get()
+    if state is not None:
+        state.stale = True
+
+
+class StaleResponseMiddleware:
+    """Добавляет STALE_HEADERS к ответам, при сборке которых вместо
+    недоступной зависимости использовались просроченные записи кэша.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        state = _StaleState()
+        token = _stale_state.set(state)
+
+        async def send_marked(message):
+            if message['type'] == 'http.response.start' and state.stale:
+                message['headers'] = [*message.get('headers', []),
+                                      *STALE_HEADERS]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_marked)
+        finally:
+            _stale_state.reset(token)
+
 
 def request_key_builder(
     func: Callable,
@@ -46,18 +147,483 @@ def class_method_key_builder(
     """
     prefix = f'{FastAPICache.get_prefix()}:{namespace}:'
     call_key = f'{func.__module__}:{func.__name__}:{args[1:]}:{kwargs}'
-    logger.info(f'Call key: {call_key}')
+    logger.debug('Call key: %s', call_key)
     return prefix + md5(call_key.encode()).hexdigest()  # noqa: S303
 
 
-def get_model_coder(model):
+# Значение модели хранится как префикс, версия схемы и JSON.
+MODEL_PREFIX = b'\x00model:'
+SCHEMA_VERSION_LENGTH = 8
+
+
+@lru_cache()
+def get_model_coder(model: Type[BaseModel], trusted: bool = True
+                    ) -> Type[Coder]:
+    """Возвращает coder для значений модели model.
+
+    Значения в кэш пишутся из уже проверенных моделей, поэтому в режиме
+    trusted модели при чтении собираются без валидации. Значение помечается
+    версией схемы модели: если схема с тех пор изменилась или значение
+    записано без версии, оно разбирается с валидацией.
+    """
+    version = md5(model.schema_json().encode()).hexdigest()[  # noqa: S303
+        :SCHEMA_VERSION_LENGTH].encode()
+    header = MODEL_PREFIX + version
+    build = _model_builder(model) if trusted else None
+
     class ModelCoder(Coder):
         @classmethod
         def encode(cls, value: Any) -> bytes:
-            return model.json(value)
+            return header + value.json().encode()
 
         @classmethod
         def decode(cls, value: bytes) -> Any:
-            return model.parse_raw(value)
+            if not value.startswith(MODEL_PREFIX):
+                return model.parse_raw(value)
+            if build is not None and value.startswith(header):
+                return build(orjson.loads(value[len(header):]))
+            return model.parse_raw(
+                value[len(MODEL_PREFIX) + SCHEMA_VERSION_LENGTH:])
 
     return ModelCoder
+
+
+def _model_builder(model: Type[BaseModel]
+                   ) -> Optional[Callable[[dict], BaseModel]]:
+    """Собирает функцию, которая строит модель из dict без валидации.
+
+    Вложенные модели и UUID восстанавливаются по типам полей. Для моделей
+    с полями других составных типов возвращает None.
+    """
+    converters = []
+    for field in model.__fields__.values():
+        if field.shape not in (SHAPE_SINGLETON, SHAPE_LIST):
+            return None
+        if isinstance(field.type_, type) and issubclass(field.type_,
+                                                        BaseModel):
+            convert = _model_builder(field.type_)
+            if convert is None:
+                return None
+        elif field.type_ is UUID:
+            convert = UUID
+        elif field.type_ in (str, int, float, bool):
+            convert = None
+        else:
+            return None
+        converters.append((field.alias, field.name, convert,
+                           field.shape == SHAPE_LIST))
+
+    def build(data: dict) -> BaseModel:
+        values = {}
+        for alias, name, convert, is_list in converters:
+            if alias not in data:
+                continue
+            value = data[alias]
+            if convert is not None and value is not None:
+                value = ([convert(item) for item in value] if is_list
+                         else convert(value))
+            values[name] = value
+        return model.construct(**values)
+
+    return build
+
+
+def tag_key(tag: str) -> str:
+    return f'{FastAPICache.get_prefix()}:tag:{tag}'
+
+
+def collect_tags(value: Any, tags: set[str], parse_str: bool = False
+                 ) -> set[str]:
+    """Собирает id фильмов, персон и жанров, которые есть в значении.
+
+    Строки проверяются на UUID, только если parse_str, — так разбираются
+    аргументы запроса, но не тексты в результате.
+    """
+    if isinstance(value, UUID):
+        tags.add(str(value))
+    elif isinstance(value, BaseModel):
+        for item in value.__dict__.values():
+            collect_tags(item, tags, parse_str)
+    elif isinstance(value, dict):
+        for item in value.values():
+            collect_tags(item, tags, parse_str)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            collect_tags(item, tags, parse_str)
+    elif parse_str and isinstance(value, str):
+        try:
+            tags.add(str(UUID(value)))
+        except ValueError:
+            pass
+    return tags
+
+
+def tag_response(response: Response, source: Any) -> Response:
+    """Помечает ответ id из source, из которого он построен.
+
+    cache берёт теги такого ответа из source, а не из тела, где после
+    выбора полей id может не остаться.
+    """
+    response.cache_tags = collect_tags(source, set(), parse_str=True)
+    return response
+
+
+async def invalidate(ids: Iterable[UUID | str]) -> int:
+    """Сбрасывает все записи кэша, в которых есть указанные id.
+
+    Возвращает число удалённых записей.
+    """
+    backend = FastAPICache.get_backend()
+    return await backend.invalidate_tags(tag_key(str(id)) for id in ids)
+
+
+def cache(
+    expire: Optional[int] = None,
+    coder: Optional[Type[Coder]] = None,
+    key_builder: Optional[Callable] = None,
+    namespace: Optional[str] = "",
+    stale: Optional[int] = None,
+    grace: Optional[int] = None,
+    uncached_params: Iterable[str] = (),
+) -> Callable:
+    """Кэширует результат корутины, как fastapi_cache.decorator.cache.
+
+    Одновременные промахи по одному ключу в рамках worker'а объединяются:
+    функция вызывается и результат записывается в кэш один раз, остальные
+    запросы ждут этот результат.
+
+    Запись помечается тегами — id фильмов, персон и жанров из аргументов
+    и результата, — чтобы её можно было сбросить через invalidate.
+
+    Запись хранится в Redis expire + stale секунд. Первые expire секунд она
+    свежая, затем ещё stale секунд отдаётся устаревшей, пока один worker,
+    взявший блокировку в Redis, обновляет её в фоне. По умолчанию stale
+    берётся из settings.redis_cache_stale_seconds, 0 отключает этот режим.
+
+    После этого запись хранится ещё grace секунд, по умолчанию
+    settings.redis_cache_grace_seconds. Такая запись считается промахом,
+    но если функция упала с DependencyUnavailableError, отдаётся она
+    с Cache-Control: max-age=0, а StaleResponseMiddleware добавляет
+    к ответу STALE_HEADERS.
+
+    Запросы с любым из query-параметров uncached_params не кэшируются.
+
+    Если функция вернула Response, в кэш записываются его тело и хэш тела.
+    Попадание отдаёт эти байты без повторной сериализации, с ETag и
+    Cache-Control по оставшемуся времени жизни записи, а на запрос
+    с совпавшим If-None-Match — 304 без тела.
+    """
+    def wrapper(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        params = signature.parameters.values()
+        request_param = next(
+            (p for p in params if p.annotation is Request), None)
+        response_param = next(
+            (p for p in params if p.annotation is Response), None)
+        parameters = [p for p in params
+                      if p.kind <= inspect.Parameter.KEYWORD_ONLY]
+        extra_params = [p for p in params
+                        if p.kind > inspect.Parameter.KEYWORD_ONLY]
+        # FastAPI передаст request и response, только если они есть
+        # в сигнатуре функции.
+        if not request_param:
+            parameters.append(inspect.Parameter(
+                name='request', annotation=Request,
+                kind=inspect.Parameter.KEYWORD_ONLY))
+        if not response_param:
+            parameters.append(inspect.Parameter(
+                name='response', annotation=Response,
+                kind=inspect.Parameter.KEYWORD_ONLY))
+        func.__signature__ = signature.replace(
+            parameters=parameters + extra_params)
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            copy_kwargs = kwargs.copy()
+            request: Optional[Request] = copy_kwargs.pop('request', None)
+            response: Optional[Response] = copy_kwargs.pop('response', None)
+            if not request_param:
+                kwargs.pop('request', None)
+            if not response_param:
+                kwargs.pop('response', None)
+
+            if (
+                not FastAPICache.get_enable()
+                or (request and request.method != 'GET')
+                or (request and request.headers.get('Cache-Control')
+                    in ('no-store', 'no-cache'))
+                or (request and any(param in request.query_params
+                                    for param in uncached_params))
+            ):
+                return await func(*args, **kwargs)
+
+            cache_coder = coder or FastAPICache.get_coder()
+            cache_expire = expire or FastAPICache.get_expire()
+            cache_stale = (settings.redis_cache_stale_seconds
+                           if stale is None else stale)
+            cache_grace = (settings.redis_cache_grace_seconds
+                           if grace is None else grace)
+            build_key = key_builder or FastAPICache.get_key_builder()
+            backend = FastAPICache.get_backend()
+
+            cache_key = build_key(func, namespace, request=request,
+                                  response=response, args=args,
+                                  kwargs=copy_kwargs)
+            if inspect.isawaitable(cache_key):
+                cache_key = await cache_key
+
+            with span('cache.get', **{'cache.key': cache_key}) as get_span:
+                try:
+                    ttl, cached = await backend.get_with_ttl(cache_key)
+                except Exception:
+                    logger.warning(f'Error retrieving cache key {cache_key}',
+                                   exc_info=True)
+                    ttl, cached = 0, None
+                get_span.set(**{'cache.hit': cached is not None})
+
+            async def load() -> tuple[Any, bool]:
+                # У загрузки своя отметка о просроченных записях: результат
+                # общий для всех ожидавших его запросов, и отметку получает
+                # каждый из них.
+                state = _StaleState()
+                token = _stale_state.set(state)
+                try:
+                    ret = await func(*args, **kwargs)
+                finally:
+                    _stale_state.reset(token)
+                tags = collect_tags((args, copy_kwargs), set(),
+                                    parse_str=True)
+                if isinstance(ret, Response):
+                    response_tags = getattr(ret, 'cache_tags', None)
+                    if response_tags is None:
+                        collect_tags(orjson.loads(ret.body), tags,
+                                     parse_str=True)
+                    else:
+                        tags |= response_tags
+                    ret = _body_response(ret.body)
+                else:
+                    collect_tags(ret, tags)
+                # Собранное из просроченных записей не выдаём за свежее.
+                if not state.stale:
+                    await _store(backend, cache_key, cache_coder, ret, tags,
+                                 cache_expire + cache_stale + cache_grace)
+                return ret, state.stale
+
+            if cached is not None:
+                try:
+                    with span('cache.decode'):
+                        ret = _decode(cache_coder, cached)
+                except Exception:
+                    logger.warning(f'Error decoding cache key {cache_key}',
+                                   exc_info=True)
+                    cached = None
+            if (cached is not None
+                    and (not cache_grace or ttl > cache_grace)
+                    and not _expires_soon(ttl - cache_grace - cache_stale)):
+                ttl -= cache_grace
+                if cache_stale and ttl <= cache_stale:
+                    _refresh_in_background(backend, cache_key, load)
+                    CACHE_REQUESTS.labels(namespace, 'stale').inc()
+                else:
+                    CACHE_REQUESTS.labels(namespace, 'hit').inc()
+                max_age = max(ttl - cache_stale, 0)
+            else:
+                try:
+                    ret, served_stale = await single_flight.do(cache_key, load)
+                except DependencyUnavailableError:
+                    if cached is None:
+                        raise
+                    logger.warning(f'Serving stale cache key {cache_key}')
+                    served_stale = True
+                    CACHE_REQUESTS.labels(namespace, 'stale').inc()
+                else:
+                    CACHE_REQUESTS.labels(namespace, 'miss').inc()
+                    if isinstance(ret, Response):
+                        # Ответ общий для всех ожидавших, заголовки у каждого
+                        # запроса свои.
+                        ret = _body_response(ret.body, _response_etag(ret))
+                if served_stale:
+                    _mark_stale()
+                max_age = 0 if served_stale else cache_expire
+
+            _set_max_age(ret, response, max_age)
+            if request and isinstance(ret, Response) and _etag_matches(
+                    request, _response_etag(ret)):
+                return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={
+                    header: ret.headers[header]
+                    for header in ('ETag', 'Cache-Control')})
+            return ret
+
+        return inner
+
+    return wrapper
+
+
+async def get_many_cached(
+    method: Callable, instance: Any, ids: list,
+    load_many: Callable[[list], Awaitable[list]],
+    coder: Type[Coder], expire: int, namespace: str = '',
+    key_builder: Callable = class_method_key_builder,
+) -> list:
+    """Возвращает instance.method(id) для каждого id из общего с cache кэша.
+
+    Ключи строятся так же, как для метода, обёрнутого в cache, поэтому
+    уже закэшированные id не загружаются. Остальные загружаются одним
+    вызовом load_many, который возвращает результаты в порядке id, и
+    записываются в кэш. Для ненайденных id возвращается None.
+
+    Записи старше expire + stale секунд загружаются заново, но, если
+    load_many упал с DependencyUnavailableError, отдаются как в cache.
+    """
+    backend = FastAPICache.get_backend()
+    keys = [key_builder(method, namespace, args=(instance, id), kwargs={})
+            for id in ids]
+    with span('cache.get_many', **{'cache.keys': len(keys)}):
+        try:
+            cached = await backend.get_many_with_ttl(keys)
+        except Exception:
+            logger.warning('Error retrieving cache keys', exc_info=True)
+            cached = [(0, None)] * len(keys)
+
+    grace = settings.redis_cache_grace_seconds
+    stale = settings.redis_cache_stale_seconds
+    with span('cache.decode'):
+        results = [_decode(coder, value) if value is not None else None
+                   for _, value in cached]
+    missing = [i for i, (ttl, value) in enumerate(cached)
+               if value is None or (grace and ttl <= grace)
+               or _expires_soon(ttl - grace - stale)]
+    CACHE_REQUESTS.labels(namespace, 'hit').inc(len(keys) - len(missing))
+    if not missing:
+        return results
+
+    try:
+        loaded = await load_many([ids[i] for i in missing])
+    except DependencyUnavailableError:
+        if any(cached[i][1] is None for i in missing):
+            raise
+        logger.warning('Serving stale cache keys')
+        _mark_stale()
+        CACHE_REQUESTS.labels(namespace, 'stale').inc(len(missing))
+        return results
+    CACHE_REQUESTS.labels(namespace, 'miss').inc(len(missing))
+    expire += stale + grace
+    stores = []
+    for i, value in zip(missing, loaded):
+        results[i] = value
+        if value is not None:
+            tags = collect_tags((ids[i], value), set(), parse_str=True)
+            stores.append(_store(backend, keys[i], coder, value, tags,
+                                 expire))
+    await asyncio.gather(*stores)
+    return results
+
+
+async def _store(backend, cache_key: str, coder: Type[Coder], value: Any,
+                 tags: set[str], expire: int) -> None:
+    try:
+        with span('cache.set', **{'cache.key': cache_key}):
+            await backend.set(cache_key, _encode(coder, value), expire)
+            await backend.add_tags(cache_key,
+                                   [tag_key(tag) for tag in tags], expire)
+    except Exception:
+        logger.warning(f'Error setting cache key {cache_key}', exc_info=True)
+
+
+def _encode(coder: Type[Coder], value: Any) -> bytes | str:
+    if isinstance(value, Response):
+        data = (RESPONSE_PREFIX + _response_etag(value).encode()
+                + value.body)
+    else:
+        data = coder.encode(value)
+    return _compress(data)
+
+
+def _compress(data: bytes | str) -> bytes | str:
+    """Сжимает значения больше settings.cache_compress_min_bytes.
+
+    Сжатое значение помечается префиксом, значения без него читаются
+    как есть. Если сжатие не уменьшает значение, оно хранится как есть.
+    """
+    min_bytes = settings.cache_compress_min_bytes
+    if not min_bytes or len(data) < min_bytes:
+        return data
+    if isinstance(data, str):
+        data = data.encode()
+    compressed = COMPRESSED_PREFIX + zlib.compress(
+        data, settings.cache_compress_level)
+    return compressed if len(compressed) < len(data) else data
+
+
+def _decode(coder: Type[Coder], value: bytes) -> Any:
+    if isinstance(value, bytes) and value.startswith(COMPRESSED_PREFIX):
+        value = zlib.decompress(value[len(COMPRESSED_PREFIX):])
+    if isinstance(value, bytes) and value.startswith(RESPONSE_PREFIX):
+        start = len(RESPONSE_PREFIX) + ETAG_LENGTH
+        return _body_response(value[start:],
+                              value[len(RESPONSE_PREFIX):start].decode())
+    return coder.decode(value)
+
+
+def _body_response(body: bytes, etag: Optional[str] = None) -> Response:
+    """Возвращает ответ с телом JSON и ETag по хэшу тела."""
+    if etag is None:
+        etag = md5(body).hexdigest()  # noqa: S303
+    return Response(body, media_type='application/json',
+                    headers={'ETag': f'"{etag}"'})
+
+
+def _response_etag(response: Response) -> str:
+    return response.headers['ETag'].strip('"')
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Проверяет, есть ли etag в заголовке If-None-Match запроса."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = {value.strip().removeprefix('W/').strip('"')
+             for value in header.split(',')}
+    return '*' in etags or etag in etags
+
+
+def _set_max_age(ret: Any, response: Optional[Response],
+                 max_age: int) -> None:
+    # Заголовки ответа, возвращённого обработчиком, FastAPI не объединяет
+    # с заголовками response.
+    if isinstance(ret, Response):
+        response = ret
+    if response:
+        response.headers['Cache-Control'] = f'max-age={max_age}'
+
+
+def _refresh_in_background(backend, cache_key: str,
+                           load: Callable[[], Awaitable]) -> None:
+    """Запускает обновление устаревшей записи, если его не ведёт другой
+    worker.
+
+    Блокировка в Redis не снимается после обновления, а истекает сама:
+    worker'ы, у которых устаревшая запись ещё лежит в локальном кэше,
+    не обновляют её повторно.
+    """
+    now = time.monotonic()
+    if _refresh_attempts.get(cache_key, 0) > now:
+        return
+    lock_seconds = settings.redis_cache_lock_seconds
+    if len(_refresh_attempts) > 10000:
+        for key, until in list(_refresh_attempts.items()):
+            if until <= now:
+                del _refresh_attempts[key]
+    _refresh_attempts[cache_key] = now + lock_seconds
+
+    async def refresh() -> None:
+        try:
+            if await backend.acquire_lock(cache_key, lock_seconds):
+                await single_flight.do(cache_key, load)
+        except Exception:
+            logger.warning(f'Error refreshing cache key {cache_key}',
+                           exc_info=True)
+
+    task = asyncio.create_task(refresh())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
@@ -0,0 +1,104 @@
+import os
+from time import perf_counter
+from typing import Awaitable, Callable, TypeVar
+
+from fastapi import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+T = TypeVar('T')
+
+# Границы для запросов, которые обычно укладываются в миллисекунды.
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                2.5)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса к API',
+    ['method', 'route', 'status'])
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Запросы к API, которые обрабатываются',
+    multiprocess_mode='livesum')
+ELASTIC_DURATION = Histogram(
+    'elasticsearch_request_duration_seconds',
+    'Время запроса к Elastic со стороны API', ['operation', 'index'])
+ELASTIC_TOOK = Histogram(
+    'elasticsearch_took_seconds', 'Время запроса по данным самого Elastic',
+    ['operation', 'index'])
+REDIS_DURATION = Histogram(
+    'redis_request_duration_seconds', 'Время запроса к Redis',
+    ['operation'], buckets=FAST_BUCKETS)
+AUTH_DURATION = Histogram(
+    'auth_request_duration_seconds', 'Время запроса к сервису авторизации',
+    ['status'])
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Обращения к кэшу: hit, miss или stale',
+    ['namespace', 'result'])
+LOCAL_CACHE_REQUESTS = Counter(
+    'local_cache_requests', "Обращения к кэшу в памяти worker'а: hit или miss",
+    ['namespace', 'result'])
+LOCAL_CACHE_ITEMS = Gauge(
+    'local_cache_items', "Записи в кэше в памяти worker'ов",
+    multiprocess_mode='livesum')
+LOCAL_CACHE_BYTES = Gauge(
+    'local_cache_bytes', "Объём кэша в памяти worker'ов",
+    multiprocess_mode='livesum')
+
+
+async def timed(histogram: Histogram, func: Callable[..., Awaitable[T]],
+                *args, **kwargs) -> T:
+    """Вызывает func и записывает время вызова в histogram."""
+    start = perf_counter()
+    try:
+        return await func(*args, **kwargs)
+    finally:
+        histogram.observe(perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """Считает время и число одновременных запросов к API.
+
+    Запрос учитывается по шаблону пути ручки, а не по самому пути, чтобы
+    число рядов не росло с числом id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            route = scope.get('route')
+            REQUEST_DURATION.labels(
+                scope['method'], route.path if route else 'unmatched',
+                status).observe(perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """Метрики в формате Prometheus.
+
+    Под gunicorn каждый worker пишет метрики в PROMETHEUS_MULTIPROC_DIR,
+    и ответ собирается из файлов всех worker'ов, какой бы из них его ни
+    отдавал.
+    """
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry),
+                    media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Имя заголовка, а не секрет.
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'  # noqa: S105
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_SUFFIX = '.folded'
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.folded$')
+
+# Профилируется один запрос за раз: сэмплер снимает стек всего потока
+# event loop, и профили одновременных запросов совпадали бы.
+_lock = threading.Lock()
+
+
+class StackSampler:
+    """Снимает стек потока каждые interval секунд из отдельного потока.
+
+    Стеки копятся в формате folded (кадры от корня через ';' и число
+    снимков), который читают flamegraph.pl, speedscope и inferno. Стек
+    потока event loop включает только выполняемую сейчас корутину
+    и ожидающие её, а пока loop ждёт ввода-вывода, в стеке select.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='stack-sampler')
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(f"{frame.f_globals.get('__name__', '?')}:"
+                              f"{frame.f_code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def folded(self) -> bytes:
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.stacks.items()).encode()
+
+
+def _should_profile(scope) -> bool:
+    if settings.admin_token:
+        token = next((value.decode('latin-1')
+                      for name, value in scope['headers']
+                      if name == PROFILE_TOKEN_HEADER.lower().encode()),
+                     None)
+        if token is not None and secrets.compare_digest(
+                token, settings.admin_token):
+            return True
+    # Выборка запросов для профиля, от случайности не зависит безопасность.
+    return random.random() < settings.profiling_sample_ratio  # noqa: S311
+
+
+class ProfilingMiddleware:
+    """Профилирует выбранные запросы и сохраняет профили в profiling_dir.
+
+    Профилируются запросы с заголовком X-Profile-Token, равным
+    admin_token, и доля settings.profiling_sample_ratio остальных.
+    Остальные запросы проходят без сэмплера. Имя профиля возвращается
+    в заголовке X-Profile-Id, а файл записывается до конца ответа, так что
+    его сразу можно скачать через служебную ручку.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not _should_profile(scope):
+            return await self.app(scope, receive, send)
+        if not _lock.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        path = re.sub(r'[^\w-]+', '_', scope['path']).strip('_')
+        name = f'{time.time_ns()}-{os.getpid()}-{path}{PROFILE_SUFFIX}'
+        last_message = None
+
+        async def send_profiled(message):
+            nonlocal last_message
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (PROFILE_ID_HEADER.lower().encode(), name.encode())]
+            elif (message['type'] == 'http.response.body'
+                  and not message.get('more_body', False)):
+                # Отправляется после записи профиля.
+                last_message = message
+                return
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(),
+                               settings.profiling_interval_ms / 1000)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            sampler.stop()
+            _lock.release()
+            try:
+                await asyncio.to_thread(save_profile, name, sampler.folded())
+            except OSError:
+                logger.warning('Profile %s is not saved', name,
+                               exc_info=True)
+        if last_message is not None:
+            await send(last_message)
+
+
+def save_profile(name: str, data: bytes) -> None:
+    """Записывает профиль и удаляет самые старые сверх profiling_max_files.
+
+    Каталог общий для всех worker'ов.
+    """
+    directory = Path(settings.profiling_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / name).write_bytes(data)
+    for old in list_profiles()[settings.profiling_max_files:]:
+        old.unlink(missing_ok=True)
+
+
+def list_profiles() -> list[Path]:
+    """Профили от новых к старым."""
+    directory = Path(settings.profiling_dir)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob(f'*{PROFILE_SUFFIX}'),
+                  key=lambda path: path.name, reverse=True)
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """Путь к профилю по имени или None, если такого профиля нет."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = Path(settings.profiling_dir) / name
+    return path if path.is_file() else None
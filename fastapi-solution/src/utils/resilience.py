@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class DependencyUnavailableError(Exception):
+    """Зависимость не ответила и после повторов."""
+
+    def __init__(self, dependency: str, retry_after: float = 0):
+        super().__init__(f'{dependency} unavailable')
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(DependencyUnavailableError):
+    """Предохранитель зависимости разомкнут, запрос не отправлялся."""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Задержка перед повтором номер attempt, считая с нуля.
+
+    Экспонента со случайной задержкой от нуля до неё (full jitter), чтобы
+    worker'ы не повторяли запросы к восстанавливающейся зависимости разом.
+    """
+    # Разброс задержек повторов, от случайности не зависит безопасность.
+    return random.uniform(0, min(cap, base * 2 ** attempt))  # noqa: S311
+
+
+class RetryBudget:
+    """Сколько повторов ещё может сделать один запрос к API по всем
+    зависимостям вместе.
+    """
+
+    def __init__(self, retries: int):
+        self.retries = retries
+
+    def take(self) -> bool:
+        if self.retries <= 0:
+            return False
+        self.retries -= 1
+        return True
+
+
+_retry_budget: ContextVar[Optional[RetryBudget]] = ContextVar(
+    'retry_budget', default=None)
+
+
+class RetryBudgetMiddleware:
+    """Выдаёт каждому HTTP-запросу свой бюджет повторов.
+
+    Вне запросов, например в фоновых задачах, повторы ограничены только
+    числом попыток каждого вызова.
+    """
+
+    def __init__(self, app, retries: int):
+        self.app = app
+        self.retries = retries
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = _retry_budget.set(RetryBudget(self.retries))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _retry_budget.reset(token)
+
+
+def _take_retry() -> bool:
+    budget = _retry_budget.get()
+    return budget is None or budget.take()
+
+
+class CircuitBreaker:
+    """Предохранитель: после failure_threshold ошибок подряд размыкается
+    и reset_timeout секунд отклоняет вызовы сразу.
+
+    Затем пропускает один пробный вызов: успех замыкает предохранитель,
+    ошибка снова размыкает его на reset_timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int,
+                 reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """Пропускает вызов или бросает CircuitOpenError.
+
+        Возвращает True, если вызов пробный.
+        """
+        if self.state == self.CLOSED:
+            return False
+        retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+        if self.state == self.OPEN and retry_after <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        raise CircuitOpenError(self.name, max(retry_after, 0))
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info('Circuit breaker %s closed', self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if (self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                logger.warning('Circuit breaker %s opened', self.name)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Освобождает пробный вызов, который не дал ответа, например был
+        отменён.
+        """
+        self._probing = False
+
+
+class Dependency:
+    """Вызовы внешней зависимости с повторами и предохранителем.
+
+    is_failure отличает отказ зависимости — нет соединения, тайм-аут,
+    ошибка сервера — от ответа, которым она отклонила запрос. Отказы
+    повторяются с экспоненциальной задержкой, пока есть попытки и бюджет
+    запроса, и считаются предохранителем. Прочие исключения пробрасываются
+    как есть.
+    """
+
+    def __init__(self, name: str,
+                 is_failure: Callable[[BaseException], bool],
+                 max_attempts: Optional[int] = None):
+        self.name = name
+        self.is_failure = is_failure
+        self.max_attempts = max_attempts or settings.retry_max_attempts
+        self.breaker = CircuitBreaker(
+            name, failure_threshold=settings.breaker_failure_threshold,
+            reset_timeout=settings.breaker_reset_seconds)
+
+    async def call(self, func: Callable[..., Awaitable[T]],
+                   *args, **kwargs) -> T:
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt >= self.max_attempts or not _take_retry():
+                    raise DependencyUnavailableError(self.name) from e
+                logger.debug('Retrying %s after %r', self.name, e)
+                await asyncio.sleep(backoff_delay(
+                    attempt - 1, settings.retry_backoff_base_ms / 1000,
+                    settings.retry_backoff_max_ms / 1000))
+                continue
+            except BaseException:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
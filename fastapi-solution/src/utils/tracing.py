@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import httpx
+import orjson
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# https://www.w3.org/TR/trace-context/#traceparent-header
+TRACEPARENT_RE = re.compile(
+    r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+TRACE_ID_HEADER = 'X-Trace-Id'
+# Сколько законченных спанов worker держит до выгрузки, лишние теряются.
+MAX_PENDING_SPANS = 10000
+
+# Виды спанов OTLP.
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span: ContextVar[Optional['Span']] = ContextVar(
+    'current_span', default=None)
+_finished: list['Span'] = []
+
+
+class Span:
+    """Участок обработки запроса: имя, время и атрибуты."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind',
+                 'attributes', 'start', 'end', 'error', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str],
+                 kind: int, attributes: dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = 0
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self._token)
+        self.end = time.time_ns()
+        if exc is not None and self.error is None:
+            self.error = repr(exc)
+        if len(_finished) < MAX_PENDING_SPANS:
+            _finished.append(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [_otlp_attribute(key, value)
+                           for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.error:
+            span['status'] = {'code': 2, 'message': self.error}
+        return span
+
+
+class _NoopSpan:
+    """Заглушка для запросов, которые не трассируются."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, kind: int = KIND_INTERNAL, **attributes: Any
+         ) -> Span | _NoopSpan:
+    """Спан внутри текущего, если запрос трассируется.
+
+    Используется как with span('cache.get', key=key) as s: ... Без
+    трассировки возвращает заглушку, и вызов почти ничего не стоит.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def _parse_traceparent(header: Optional[str]
+                       ) -> Optional[tuple[str, str, bool]]:
+    match = TRACEPARENT_RE.match(header or '')
+    if match is None:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def _sampled(trace_id: str, ratio: float) -> bool:
+    """Решение о трассировке по младшим 8 байтам id трассировки.
+
+    Они случайны, и сервисы с той же долей примут по этому id одно
+    и то же решение.
+    """
+    return int(trace_id[16:], 16) < ratio * 2 ** 64
+
+
+class TracingMiddleware:
+    """Начинает трассировку HTTP-запроса.
+
+    Идентификатор трассировки и решение о ней берутся из заголовка
+    traceparent, а без него для запроса создаётся случайный id, и он
+    трассируется с вероятностью settings.tracing_sample_ratio. Решение
+    принимается один раз в начале запроса, и все спаны внутри него либо
+    пишутся, либо нет. Ответу трассируемого запроса добавляются заголовок
+    с id трассировки и traceparent со спаном запроса, к которому клиент
+    может привязать свои спаны.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        parent = _parse_traceparent(next(
+            (value.decode('latin-1') for name, value in scope['headers']
+             if name == b'traceparent'), None))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = _sampled(trace_id, settings.tracing_sample_ratio)
+        if not sampled:
+            return await self.app(scope, receive, send)
+
+        root = Span(f"{scope['method']} {scope['path']}", trace_id,
+                    parent_id, KIND_SERVER,
+                    {'http.method': scope['method'],
+                     'http.target': scope['path']})
+
+        async def send_traced(message):
+            if message['type'] == 'http.response.start':
+                root.set(**{'http.status_code': message['status']})
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (TRACE_ID_HEADER.lower().encode(), trace_id.encode()),
+                    (b'traceparent',
+                     f'00-{trace_id}-{root.span_id}-01'.encode())]
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_traced)
+            finally:
+                route = scope.get('route')
+                if route is not None:
+                    root.name = f"{scope['method']} {route.path}"
+                    root.set(**{'http.route': route.path})
+
+
+class SpanExporter:
+    """Выгружает законченные спаны в формате OTLP JSON.
+
+    Спаны пишутся в файл, по запросу ExportTraceServiceRequest в строке,
+    или отправляются в коллектор по OTLP/HTTP.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient,
+                 file: Optional[str] = None,
+                 endpoint: Optional[str] = None):
+        self.http_client = http_client
+        self.file = file
+        self.endpoint = endpoint
+        self.resource = {'attributes': [
+            _otlp_attribute('service.name', settings.tracing_service_name),
+            _otlp_attribute('process.pid', os.getpid()),
+        ]}
+
+    async def export(self) -> None:
+        if not _finished:
+            return
+        spans = _finished[:]
+        del _finished[:len(spans)]
+        data = orjson.dumps({'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [finished.to_otlp() for finished in spans],
+            }],
+        }]})
+        if self.file:
+            await asyncio.to_thread(self._write, data)
+        if self.endpoint:
+            response = await self.http_client.post(
+                f'{self.endpoint}/v1/traces', content=data,
+                headers={'Content-Type': 'application/json'})
+            response.raise_for_status()
+
+    def _write(self, data: bytes) -> None:
+        with open(self.file, 'ab') as file:
+            file.write(data + b'\n')
+
+    async def export_periodically(self, interval: float) -> None:
+        """Выгружает спаны каждые interval секунд до отмены задачи."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.export()
+            except Exception:
+                logger.warning('Span export failed', exc_info=True)
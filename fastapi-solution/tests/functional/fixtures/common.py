@@ -1,4 +1,5 @@
 import asyncio
+from http import HTTPStatus
 
 import pytest
 from aiohttp import ClientSession
@@ -23,9 +24,29 @@ async def aiohttp_session():
 
 @pytest.fixture
 def make_get_request(aiohttp_session: ClientSession):
-    async def inner(endpoint: str, params: dict = {}):
-        url = (f'{settings.api_url}{endpoint}')
-        async with aiohttp_session.get(url, params=params) as response:
+    async def inner(endpoint: str, params: dict = {}, headers: dict = {},
+                    api_url: str = settings.api_url):
+        url = (f'{api_url}{endpoint}')
+        async with aiohttp_session.get(url, params=params,
+                                       headers=headers) as response:
+            return {
+                'status': response.status,
+                'headers': response.headers,
+                'body': (await response.json()
+                         if response.status != HTTPStatus.NOT_MODIFIED
+                         else None)
+            }
+
+    return inner
+
+
+@pytest.fixture
+def make_post_request(aiohttp_session: ClientSession):
+    async def inner(endpoint: str, json: dict = {}, headers: dict = {},
+                    api_url: str = settings.api_url):
+        url = (f'{api_url}{endpoint}')
+        async with aiohttp_session.post(url, json=json,
+                                        headers=headers) as response:
             return {
                 'status': response.status,
                 'headers': response.headers,
@@ -33,3 +54,15 @@ def make_get_request(aiohttp_session: ClientSession):
             }
 
     return inner
+
+
+@pytest.fixture
+def invalidate_cache(make_post_request):
+    """Сбрасывает кэш по id через служебную ручку API."""
+    async def inner(ids: list[str]):
+        response = await make_post_request(
+            '/api/v1/admin/cache/invalidate', {'ids': ids},
+            headers={'X-Admin-Token': settings.admin_token})
+        assert response['status'] == HTTPStatus.OK
+
+    return inner
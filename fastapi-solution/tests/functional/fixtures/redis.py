@@ -11,7 +11,14 @@ async def redis_client():
     await client.close()
 
 
+@pytest.fixture(scope='session')
+async def warmer_redis_client():
+    client = Redis.from_url(settings.warmer_redis_dsn)
+    yield client
+    await client.close()
+
+
 @pytest.fixture(autouse=True)
 async def redis_flushall(redis_client):
-    """Сбрасывает кэш в Redis для каждого теста."""
+    """Сбрасывает кэш во всех базах Redis для каждого теста."""
     await redis_client.flushall()
@@ -5,6 +5,13 @@ class TestSettings(BaseSettings):
     elastic_dsn: AnyUrl = 'http://127.0.0.1:9200'
     redis_dsn: RedisDsn = 'redis://127.0.0.1:6379'
     api_url: AnyUrl = 'http://127.0.0.1:8000'
+    # API с тем же Redis, но без доступа к Elastic.
+    elastic_down_api_url: AnyUrl = 'http://127.0.0.1:8001'
+    # API с частым прогревом кэша.
+    warmer_api_url: AnyUrl = 'http://127.0.0.1:8002'
+    # База Redis, в которой кэш API с прогревом.
+    warmer_redis_dsn: RedisDsn = 'redis://127.0.0.1:6379/1'
+    admin_token: str = 'test-admin-token'
 
 
 settings = TestSettings()
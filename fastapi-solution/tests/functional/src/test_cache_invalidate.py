@@ -0,0 +1,107 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+ENDPOINT = '/api/v1/admin/cache/invalidate'
+
+
+async def test_cache_invalidate_film(
+    es_write_data, make_get_request, make_post_request
+):
+    film = {
+        'id': str(uuid4()), 'title': 'The Matrix 1',
+        'imdb_rating': 7.7,  'description': 'Text',
+        'genres': [], 'actors': [], 'writers': [], 'directors': []
+    }
+    await es_write_data('movies', [film])
+    response = await make_get_request(f'/api/v1/films/{film["id"]}')
+    assert response['body']['title'] == 'The Matrix 1'
+    response = await make_get_request('/api/v1/films/search',
+                                      {'query': 'Matrix'})
+    assert response['body'][0]['title'] == 'The Matrix 1'
+
+    # Запросы возвращают данные из кэша, несмотря на обновление в ES.
+    film['title'] = 'The Matrix 2'
+    await es_write_data('movies', [film])
+    response = await make_get_request(f'/api/v1/films/{film["id"]}')
+    assert response['body']['title'] == 'The Matrix 1'
+
+    # После сброса по id фильма все записи с ним содержат свежие данные.
+    response = await make_post_request(
+        ENDPOINT, {'ids': [film['id']]},
+        headers={'X-Admin-Token': settings.admin_token})
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'] == {'deleted': 2}
+
+    response = await make_get_request(f'/api/v1/films/{film["id"]}')
+    assert response['body']['title'] == 'The Matrix 2'
+    response = await make_get_request('/api/v1/films/search',
+                                      {'query': 'Matrix'})
+    assert response['body'][0]['title'] == 'The Matrix 2'
+
+
+async def test_cache_invalidate_person_films(
+    es_write_data, make_get_request, make_post_request
+):
+    person_id = str(uuid4())
+    await es_write_data('persons', [{'id': person_id, 'full_name': 'Ann'}])
+    response = await make_get_request(f'/api/v1/persons/{person_id}/film')
+    assert response['body'] == []
+
+    # Фильм с персоной появляется после сброса по id персоны.
+    film = {'id': str(uuid4()), 'title': 'Movie', 'imdb_rating': 1.0,
+            'actors': [{'id': person_id, 'name': 'Ann'}]}
+    await es_write_data('movies', [film])
+    response = await make_get_request(f'/api/v1/persons/{person_id}/film')
+    assert response['body'] == []
+
+    await make_post_request(ENDPOINT, {'ids': [person_id]},
+                            headers={'X-Admin-Token': settings.admin_token})
+    response = await make_get_request(f'/api/v1/persons/{person_id}/film')
+    assert [item['uuid'] for item in response['body']] == [film['id']]
+
+
+async def test_cache_invalidate_sparse_fieldset(
+    es_write_data, make_get_request, make_post_request
+):
+    film = {'id': str(uuid4()), 'title': 'Sparse 1', 'imdb_rating': 5.0}
+    await es_write_data('movies', [film])
+    params = {'fields': ['title']}
+    response = await make_get_request('/api/v1/films', params)
+    assert response['body'] == [{'title': 'Sparse 1'}]
+
+    # В ответе нет id фильма, но запись всё равно сбрасывается по нему.
+    film['title'] = 'Sparse 2'
+    await es_write_data('movies', [film])
+    response = await make_post_request(
+        ENDPOINT, {'ids': [film['id']]},
+        headers={'X-Admin-Token': settings.admin_token})
+    assert response['body'] == {'deleted': 1}
+
+    response = await make_get_request('/api/v1/films', params)
+    assert response['body'] == [{'title': 'Sparse 2'}]
+
+
+@pytest.mark.parametrize(
+    'headers, body, expected_status',
+    [
+        ({}, {'ids': [str(uuid4())]}, HTTPStatus.FORBIDDEN),
+        ({'X-Admin-Token': 'invalid'}, {'ids': [str(uuid4())]},
+         HTTPStatus.FORBIDDEN),
+        ({'X-Admin-Token': settings.admin_token}, {'ids': []},
+         HTTPStatus.UNPROCESSABLE_ENTITY),
+        ({'X-Admin-Token': settings.admin_token}, {'ids': ['invalid_id']},
+         HTTPStatus.UNPROCESSABLE_ENTITY),
+    ]
+)
+async def test_cache_invalidate_validation(
+    make_post_request, headers, body, expected_status
+):
+    response = await make_post_request(ENDPOINT, body, headers=headers)
+
+    assert response['status'] == expected_status
@@ -0,0 +1,47 @@
+import asyncio
+from http import HTTPStatus
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+STATS_KEY = 'fastapi-cache:stats:film_details'
+
+
+async def wait_for(check: Callable[[], Awaitable], timeout: float = 10
+                   ) -> bool:
+    for _ in range(int(timeout / 0.2)):
+        if await check():
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def test_warmer_loads_frequently_requested_film(
+    es_write_data, make_get_request, make_post_request, redis_client,
+    warmer_redis_client
+):
+    film = {'id': str(uuid4()), 'title': 'Movie', 'imdb_rating': 5.0}
+    await es_write_data('movies', [film])
+    response = await make_get_request(f'/api/v1/films/{film["id"]}',
+                                      api_url=settings.warmer_api_url)
+    assert response['status'] == HTTPStatus.OK
+    assert await wait_for(
+        lambda: warmer_redis_client.zscore(STATS_KEY, film['id']))
+
+    # После сброса вернуть фильм в кэш может только прогрев.
+    tag = f'fastapi-cache:tag:{film["id"]}'
+    response = await make_post_request(
+        '/api/v1/admin/cache/invalidate', {'ids': [film['id']]},
+        headers={'X-Admin-Token': settings.admin_token},
+        api_url=settings.warmer_api_url)
+    assert response['status'] == HTTPStatus.OK
+    assert not await warmer_redis_client.exists(tag)
+
+    assert await wait_for(lambda: warmer_redis_client.exists(tag))
+    # Кэш api, который проверяют остальные тесты, прогрев не трогает.
+    assert not await redis_client.exists(tag)
@@ -0,0 +1,21 @@
+from http import HTTPStatus
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_elastic_unavailable(make_get_request):
+    responses = [
+        await make_get_request('/api/v1/films', {'page_number': page},
+                               api_url=settings.elastic_down_api_url)
+        for page in range(1, 4)]
+
+    for response in responses:
+        assert response['status'] == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response['body'] == {'detail': 'elasticsearch unavailable'}
+    # После нескольких отказов подряд предохранитель разомкнут, и API
+    # сразу отвечает, когда повторить запрос.
+    assert int(responses[-1]['headers']['Retry-After']) > 0
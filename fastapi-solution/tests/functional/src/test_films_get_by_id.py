@@ -128,3 +128,51 @@ async def test_films_get_by_id_cache(
     await redis_client.flushall()
     response = await make_get_request(f'/api/v1/films/{film["id"]}')
     assert response['body']['title'] == 'The Matrix 2'
+
+
+async def test_films_bulk(es_write_data, make_get_request):
+    films = [
+        {
+            'id': str(uuid4()), 'title': f'Film {i}',
+            'imdb_rating': float(i), 'description': '',
+            'genres': [], 'actors': [], 'writers': [], 'directors': []
+        }
+        for i in range(3)
+    ]
+    await es_write_data('movies', films)
+
+    # Неизвестные id пропускаются, повторные id отдаются один раз.
+    ids = [films[2]['id'], str(uuid4()), films[0]['id'], films[2]['id']]
+    response = await make_get_request('/api/v1/films/bulk', {'ids': ids})
+
+    assert response['status'] == HTTPStatus.OK
+    assert [film['uuid'] for film in response['body']] == [
+        films[2]['id'], films[0]['id']]
+
+
+@pytest.mark.parametrize(
+    'request_params',
+    [{}, {'ids': ['invalid_id']}, {'ids': [str(uuid4()) for _ in range(101)]}]
+)
+async def test_films_bulk_invalid(make_get_request, request_params):
+    response = await make_get_request('/api/v1/films/bulk', request_params)
+
+    assert response['status'] == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_films_get_by_id_fields(es_write_data, make_get_request):
+    await es_write_data('movies', [{
+        'id': MOVIE1_ID, 'title': 'Film 1',
+        'imdb_rating': 1.1, 'description': 'Text 1',
+        'genres': [{'id': COMEDY_ID, 'name': 'Comedy'}],
+        'actors': [], 'writers': [], 'directors': [],
+    }])
+
+    response = await make_get_request(f'/api/v1/films/{MOVIE1_ID}',
+                                      {'fields': ['genre', 'title']})
+
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'] == {
+        'title': 'Film 1',
+        'genre': [{'uuid': COMEDY_ID, 'name': 'Comedy'}],
+    }
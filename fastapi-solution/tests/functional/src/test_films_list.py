@@ -1,3 +1,5 @@
+import json
+from base64 import urlsafe_b64encode
 from http import HTTPStatus
 from uuid import uuid4
 
@@ -63,6 +65,7 @@ async def test_films_list(
     'request_params, expected_response_length',
     [
         ({'page_size': 100}, 60),
+        ({'page_size': 10001}, 60),
         ({}, 50),
         ({'page_size': 40, 'page_number': 1}, 40),
         ({'page_size': 40, 'page_number': 2}, 20),
@@ -92,6 +95,7 @@ async def test_films_list_pagination(
         ({'genre': 'invalid_id'}),
         ({'page_size': 40, 'page_number': -1}),
         ({'page_size': -1, 'page_number': 1}),
+        ({'fields': ['description']}),
     ]
 )
 async def test_films_list_validation(
@@ -108,6 +112,39 @@ async def test_films_list_validation(
     assert response['status'] == HTTPStatus.UNPROCESSABLE_ENTITY
 
 
+async def test_films_list_fields(es_write_data, make_get_request):
+    film = {'id': str(uuid4()), 'title': 'The Matrix', 'imdb_rating': 8.7}
+    await es_write_data('movies', [film])
+
+    # Поля ответа идут в порядке модели, а не запроса.
+    response = await make_get_request('/api/v1/films',
+                                      {'fields': ['title', 'uuid']})
+
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'] == [{'uuid': film['id'], 'title': film['title']}]
+
+
+async def test_films_list_etag(es_write_data, make_get_request):
+    film = {'id': str(uuid4()), 'title': 'The Matrix', 'imdb_rating': 8.7}
+    await es_write_data('movies', [film])
+    response = await make_get_request('/api/v1/films')
+    etag = response['headers']['ETag']
+
+    # Ответ из кэша совпадает с первым, в том числе по ETag.
+    response = await make_get_request('/api/v1/films')
+    assert response['headers']['ETag'] == etag
+
+    response = await make_get_request('/api/v1/films',
+                                      headers={'If-None-Match': etag})
+    assert response['status'] == HTTPStatus.NOT_MODIFIED
+    assert response['headers']['ETag'] == etag
+
+    response = await make_get_request('/api/v1/films',
+                                      headers={'If-None-Match': '"other"'})
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'][0]['uuid'] == film['id']
+
+
 async def test_films_list_cache(
     es_write_data, make_get_request, redis_client
 ):
@@ -126,3 +163,69 @@ async def test_films_list_cache(
     await redis_client.flushall()
     response = await make_get_request('/api/v1/films')
     assert len(response['body']) == 2
+
+
+async def test_films_list_cursor(es_write_data, make_get_request):
+    data = [
+        {'id': str(uuid4()), 'title': f'Movie {i}', 'imdb_rating': i / 10}
+        for i in range(60)
+    ]
+    await es_write_data('movies', data)
+
+    pages = []
+    params = {'sort': ['-imdb_rating'], 'page_size': 25, 'cursor': ''}
+    while True:
+        response = await make_get_request('/api/v1/films', params)
+        assert response['status'] == HTTPStatus.OK
+        pages.append(response['body'])
+        if 'X-Next-Cursor' not in response['headers']:
+            break
+        params['cursor'] = response['headers']['X-Next-Cursor']
+
+    assert [len(page) for page in pages] == [25, 25, 10]
+    assert [film['uuid'] for page in pages for film in page] == [
+        film['id'] for film in reversed(data)
+    ]
+
+
+async def test_films_list_cursor_large_page(es_write_data, make_get_request):
+    await es_write_data('movies', [
+        {'id': str(uuid4()), 'title': f'Movie {i}', 'imdb_rating': i / 10}
+        for i in range(3)
+    ])
+
+    # Размер страницы больше max_page_size уменьшается до него.
+    response = await make_get_request('/api/v1/films',
+                                      {'page_size': 10001, 'cursor': ''})
+
+    assert response['status'] == HTTPStatus.OK
+    assert len(response['body']) == 3
+    assert 'X-Next-Cursor' not in response['headers']
+
+
+async def test_films_list_invalid_cursor(make_get_request):
+    response = await make_get_request('/api/v1/films',
+                                      {'cursor': 'invalid_cursor'})
+
+    assert response['status'] == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    'cursor',
+    [
+        {'pit': 'tampered', 'after': [9.2, 0]},
+        {'pit': 'tampered'},
+        ['not', 'a', 'cursor'],
+    ]
+)
+async def test_films_list_tampered_cursor(
+    es_write_data, make_get_request, cursor
+):
+    await es_write_data('movies', [
+        {'id': str(uuid4()), 'title': 'The Godfather', 'imdb_rating': 9.2}
+    ])
+    response = await make_get_request('/api/v1/films', {
+        'cursor': urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+    })
+
+    assert response['status'] == HTTPStatus.BAD_REQUEST
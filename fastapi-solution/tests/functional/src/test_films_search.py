@@ -10,6 +10,7 @@ pytestmark = pytest.mark.asyncio
     'request_params, expected_response_length',
     [
         ({'query': 'Godfather', 'page_size': 100}, 60),
+        ({'query': 'Godfather', 'page_size': 10001}, 60),
         ({'query': 'Matrix', 'page_size': 100}, 3),
         ({'query': 'Star Wars', 'page_size': 100}, 0),
         ({'query': 'Godfather Matrix', 'page_size': 100}, 63),
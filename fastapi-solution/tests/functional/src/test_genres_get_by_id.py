@@ -38,7 +38,7 @@ pytestmark = pytest.mark.asyncio
     ]
 )
 async def test_genres_get_by_id(
-    es_write_data, make_get_request,
+    es_write_data, make_get_request, invalidate_cache,
     genre_id, expected_response
 ):
     data = [
@@ -53,27 +53,49 @@ async def test_genres_get_by_id(
     ]
 
     await es_write_data('genres', data)
+    await invalidate_cache([genre['id'] for genre in data])
     response = await make_get_request(f'/api/v1/genres/{genre_id}')
 
     assert response['status'] == expected_response['status']
     assert response['body'] == expected_response['body']
 
 
-async def test_genres_get_by_id_cache(
-    es_write_data, make_get_request, redis_client
+async def test_genres_get_by_id_snapshot(
+    es_write_data, make_get_request, invalidate_cache
 ):
     genre_id = '5373d043-3f41-4ea8-9947-4b746c601bbd'
 
     await es_write_data('genres', [{'id': genre_id, 'name': 'Comedy'}])
+    await invalidate_cache([genre_id])
     response = await make_get_request(f'/api/v1/genres/{genre_id}')
     assert response['body']['name'] == 'Comedy'
 
-    # Запрос возвращает данные из кэша, несмотря на обновление в ES.
+    # Запрос возвращает данные из снимка в памяти, несмотря на обновление
+    # в ES и сброс Redis.
     await es_write_data('genres', [{'id': genre_id, 'name': 'Drama'}])
     response = await make_get_request(f'/api/v1/genres/{genre_id}')
     assert response['body']['name'] == 'Comedy'
 
-    # После сброса кэша запрос возврашает свежие данные из ES.
-    await redis_client.flushall()
+    # После сброса кэша снимок перечитывается из ES.
+    await invalidate_cache([genre_id])
     response = await make_get_request(f'/api/v1/genres/{genre_id}')
     assert response['body']['name'] == 'Drama'
+
+
+async def test_genres_bulk(es_write_data, make_get_request,
+                           invalidate_cache):
+    comedy = {'id': '5373d043-3f41-4ea8-9947-4b746c601bbd', 'name': 'Comedy'}
+    drama = {'id': '1cacff68-643e-4ddd-8f57-84b62538081a', 'name': 'Drama'}
+    await es_write_data('genres', [comedy, drama])
+    await invalidate_cache([comedy['id'], drama['id']])
+
+    response = await make_get_request('/api/v1/genres/bulk', {
+        'ids': [drama['id'], 'b92ef010-5e4c-4fd0-99d6-41b6456272cd',
+                comedy['id']]
+    })
+
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'] == [
+        {'uuid': drama['id'], 'name': 'Drama'},
+        {'uuid': comedy['id'], 'name': 'Comedy'},
+    ]
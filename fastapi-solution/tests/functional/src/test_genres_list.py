@@ -6,10 +6,12 @@ import pytest
 pytestmark = pytest.mark.asyncio
 
 
-async def test_genres_list(es_write_data, make_get_request):
+async def test_genres_list(es_write_data, make_get_request,
+                           invalidate_cache):
     comedy = {'id': '2a16de1f-9d71-4243-8ca2-242f5054ee20', 'name': 'Comedy'}
     drama = {'id': '6b304ec9-dcf6-49f3-ae16-aa6600923e2d', 'name': 'Drama'}
     await es_write_data('genres', [comedy, drama])
+    await invalidate_cache([comedy['id'], drama['id']])
 
     response = await make_get_request('/api/v1/genres')
 
@@ -20,21 +22,22 @@ async def test_genres_list(es_write_data, make_get_request):
     ]
 
 
-async def test_genres_list_cache(
-    es_write_data, make_get_request, redis_client
+async def test_genres_list_snapshot(
+    es_write_data, make_get_request, invalidate_cache
 ):
     genre1 = {'id': str(uuid4()), 'name': 'Comedy'}
     await es_write_data('genres', [genre1])
+    await invalidate_cache([genre1['id']])
     response = await make_get_request('/api/v1/genres')
     assert len(response['body']) == 1
 
-    # Запрос возвращает данные из кэша, несмотря на обновление в ES.
+    # Запрос возвращает данные из снимка, несмотря на обновление в ES.
     genre2 = {'id': str(uuid4()), 'name': 'Drama'}
     await es_write_data('genres', [genre2])
     response = await make_get_request('/api/v1/genres')
     assert len(response['body']) == 1
 
-    # После сброса кэша запрос возврашает свежие данные из ES.
-    await redis_client.flushall()
+    # После сброса кэша снимок перечитывается из ES.
+    await invalidate_cache([genre2['id']])
     response = await make_get_request('/api/v1/genres')
     assert len(response['body']) == 2
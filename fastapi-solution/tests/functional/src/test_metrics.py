@@ -0,0 +1,20 @@
+from http import HTTPStatus
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_metrics(aiohttp_session, make_get_request):
+    await make_get_request('/api/v1/genres')
+
+    async with aiohttp_session.get(f'{settings.api_url}/metrics') as response:
+        assert response.status == HTTPStatus.OK
+        body = await response.text()
+
+    # Запрос учитывается по шаблону пути ручки.
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/api/v1/genres",status="200"}') in body
+    assert 'http_requests_in_progress' in body
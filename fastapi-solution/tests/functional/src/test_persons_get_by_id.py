@@ -1,4 +1,5 @@
 from http import HTTPStatus
+from uuid import uuid4
 
 import pytest
 
@@ -103,3 +104,26 @@ async def test_persons_get_by_id_cache(
     await redis_client.flushall()
     response = await make_get_request(f'/api/v1/persons/{person_id}')
     assert response['body']['full_name'] == 'Bob'
+
+
+async def test_persons_get_by_id_all_films(es_write_data, make_get_request):
+    ann = {'id': '5fde96c3-ddc6-49fc-816c-efda8304eb20', 'name': 'Ann'}
+    await es_write_data('persons', [{'id': ann['id'], 'full_name': 'Ann'}])
+    # Фильмов больше, чем помещается в одну страницу поиска.
+    films = [
+        {'id': str(uuid4()), 'title': f'Movie {i}',
+         'actors': [ann], 'writers': [ann] if i % 2 else [], 'directors': []}
+        for i in range(1500)
+    ]
+    await es_write_data('movies', films)
+
+    response = await make_get_request(f'/api/v1/persons/{ann["id"]}')
+
+    assert response['status'] == HTTPStatus.OK
+    assert sorted(
+        (film['uuid'], tuple(film['roles']))
+        for film in response['body']['films']
+    ) == sorted(
+        (film['id'], ('actor', 'writer') if i % 2 else ('actor',))
+        for i, film in enumerate(films)
+    )
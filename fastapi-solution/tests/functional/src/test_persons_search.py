@@ -5,6 +5,9 @@ import pytest
 
 pytestmark = pytest.mark.asyncio
 
+ANN_ID = '5fde96c3-ddc6-49fc-816c-efda8304eb20'
+MOVIE_ID = 'b819ed53-ae49-47fb-b6e0-2cf2b40620e0'
+
 
 @pytest.mark.parametrize(
     'request_params, expected_response_body',
@@ -81,6 +84,7 @@ async def test_persons_search_format(
     'request_params, expected_response_length',
     [
         ({'query': 'Ann', 'page_size': 100}, 60),
+        ({'query': 'Ann', 'page_size': 10001}, 60),
         ({'query': 'Bob', 'page_size': 100}, 3),
         ({'query': 'Cat', 'page_size': 100}, 0),
         ({'query': 'Ann Bob', 'page_size': 100}, 63),
@@ -149,3 +153,45 @@ async def test_persons_search_cache(
     response = await make_get_request('/api/v1/persons/search',
                                       {'query': 'Ann'})
     assert len(response['body']) == 2
+
+
+async def test_persons_search_cursor(es_write_data, make_get_request):
+    data = [{'id': str(uuid4()), 'full_name': 'Ann'} for _ in range(30)]
+    await es_write_data('persons', data)
+
+    ids = []
+    params = {'query': 'Ann', 'page_size': 20, 'cursor': ''}
+    while True:
+        response = await make_get_request('/api/v1/persons/search', params)
+        assert response['status'] == HTTPStatus.OK
+        ids.extend(person['uuid'] for person in response['body'])
+        if 'X-Next-Cursor' not in response['headers']:
+            break
+        params['cursor'] = response['headers']['X-Next-Cursor']
+
+    assert sorted(ids) == sorted(person['id'] for person in data)
+
+
+@pytest.mark.parametrize(
+    'fields, expected_person',
+    [
+        (['full_name'], {'full_name': 'Ann'}),
+        (['uuid', 'films'], {'uuid': ANN_ID, 'films': [
+            {'uuid': MOVIE_ID, 'roles': ['actor', 'director']}]}),
+    ]
+)
+async def test_persons_search_fields(
+    es_write_data, make_get_request, fields, expected_person
+):
+    ann = {'id': ANN_ID, 'name': 'Ann'}
+    await es_write_data('persons', [{'id': ANN_ID, 'full_name': 'Ann'}])
+    await es_write_data('movies', [{
+        'id': MOVIE_ID, 'title': 'Movie 1',
+        'actors': [ann], 'writers': [], 'directors': [ann],
+    }])
+
+    response = await make_get_request('/api/v1/persons/search',
+                                      {'query': 'Ann', 'fields': fields})
+
+    assert response['status'] == HTTPStatus.OK
+    assert response['body'] == [expected_person]
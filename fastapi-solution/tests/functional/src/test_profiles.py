@@ -0,0 +1,33 @@
+from http import HTTPStatus
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+ENDPOINT = '/api/v1/admin/profiles'
+
+
+async def test_profile_request(make_get_request):
+    response = await make_get_request('/api/v1/persons/search',
+                                      {'query': 'Ann'})
+    assert 'X-Profile-Id' not in response['headers']
+
+    response = await make_get_request(
+        '/api/v1/persons/search', {'query': 'Ann'},
+        headers={'X-Profile-Token': settings.admin_token})
+    assert response['status'] == HTTPStatus.OK
+    name = response['headers']['X-Profile-Id']
+
+    # Профиль сохранён до конца ответа и сразу доступен.
+    response = await make_get_request(
+        ENDPOINT, headers={'X-Admin-Token': settings.admin_token})
+    assert name in [profile['name'] for profile in response['body']]
+
+
+async def test_profile_not_found(make_get_request):
+    response = await make_get_request(
+        f'{ENDPOINT}/missing.folded',
+        headers={'X-Admin-Token': settings.admin_token})
+    assert response['status'] == HTTPStatus.NOT_FOUND
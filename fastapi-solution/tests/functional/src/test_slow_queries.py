@@ -0,0 +1,52 @@
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+ENDPOINT = '/api/v1/admin/slow-queries'
+
+
+async def test_slow_queries_require_admin_token(make_get_request):
+    response = await make_get_request(ENDPOINT)
+    assert response['status'] == HTTPStatus.FORBIDDEN
+
+
+async def test_slow_queries(es_write_data, make_get_request):
+    await es_write_data('movies', [
+        {'id': str(uuid4()), 'title': 'Movie', 'imdb_rating': 5.0}])
+    titles = [f'Slow {uuid4().hex}' for _ in range(10)]
+    # Разные строки поиска не попадают в кэш и дают один вид запроса.
+    # Журнал свой у каждого worker'а, поэтому запросов несколько.
+    for title in titles:
+        response = await make_get_request('/api/v1/films/search',
+                                          {'query': title})
+        assert response['status'] == HTTPStatus.OK
+
+    response = await make_get_request(
+        ENDPOINT, {'limit': 1000},
+        headers={'X-Admin-Token': settings.admin_token})
+    assert response['status'] == HTTPStatus.OK
+    assert response['body']['threshold_ms'] == 1
+
+    searches = [query for query in response['body']['queries']
+                if 'services.film.FilmService.search' in query['callers']]
+    assert searches
+    for search in searches:
+        assert (search['operation'], search['index']) == ('search', 'movies')
+        assert search['fingerprint']
+        assert search['count'] >= 1
+        # Значения запроса в отпечатке не сохраняются.
+        assert '"?"' in search['query']
+        assert not any(title in search['query'] for title in titles)
+
+
+async def test_slow_queries_limit(make_get_request):
+    response = await make_get_request(
+        ENDPOINT, {'limit': 1},
+        headers={'X-Admin-Token': settings.admin_token})
+    assert response['status'] == HTTPStatus.OK
+    assert len(response['body']['queries']) <= 1
@@ -0,0 +1,62 @@
+import asyncio
+from hashlib import md5
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+
+from settings import settings
+
+pytestmark = pytest.mark.asyncio
+
+ENDPOINT = '/api/v1/films'
+# Ключ ответа ENDPOINT без параметров, как его строит request_key_builder.
+CACHE_KEY = 'fastapi-cache:films:' + md5(  # noqa: S303
+    f'GET:{ENDPOINT}:[]'.encode()).hexdigest()
+# Настройки API по умолчанию: запись хранится expire + stale + grace
+# секунд, последние grace из них её отдают, только если Elastic недоступен.
+EXPIRE, STALE, GRACE = 300, 60, 120
+
+
+async def test_grace_entry_is_served_when_elastic_is_down(
+    es_write_data, make_get_request, redis_client
+):
+    await es_write_data('movies', [{'id': str(uuid4()), 'title': 'Movie',
+                                    'imdb_rating': 5.0}])
+    response = await make_get_request(ENDPOINT)
+    assert response['status'] == HTTPStatus.OK
+    assert await redis_client.ttl(CACHE_KEY) == EXPIRE + STALE + GRACE
+
+    # Запись просрочена, но ещё в окне grace.
+    await redis_client.expire(CACHE_KEY, GRACE // 2)
+    stale = await make_get_request(
+        ENDPOINT, api_url=settings.elastic_down_api_url)
+    assert stale['status'] == HTTPStatus.OK
+    assert stale['body'] == response['body']
+    assert stale['headers']['X-Cache'] == 'STALE'
+    assert stale['headers']['Cache-Control'] == 'max-age=0'
+    assert 'Revalidation Failed' in stale['headers']['Warning']
+
+
+async def test_stale_entry_is_refreshed_in_background(
+    es_write_data, make_get_request, redis_client
+):
+    film = {'id': str(uuid4()), 'title': 'Old', 'imdb_rating': 5.0}
+    await es_write_data('movies', [film])
+    await make_get_request(ENDPOINT)
+
+    # Запись в окне stale: отдаётся как есть и обновляется в фоне.
+    film['title'] = 'New'
+    await es_write_data('movies', [film])
+    await redis_client.expire(CACHE_KEY, GRACE + STALE // 2)
+    response = await make_get_request(ENDPOINT)
+    assert response['body'][0]['title'] == 'Old'
+    assert response['headers']['Cache-Control'] == 'max-age=0'
+    assert 'X-Cache' not in response['headers']
+
+    for _ in range(50):
+        if await redis_client.ttl(CACHE_KEY) > GRACE + STALE:
+            break
+        await asyncio.sleep(0.1)
+    response = await make_get_request(ENDPOINT)
+    assert response['body'][0]['title'] == 'New'
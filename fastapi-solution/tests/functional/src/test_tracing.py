@@ -0,0 +1,32 @@
+import os
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_traceparent_is_propagated(es_write_data, make_get_request):
+    film = {'id': str(uuid4()), 'title': 'Movie', 'imdb_rating': 5.0}
+    await es_write_data('movies', [film])
+    trace_id, parent_id = os.urandom(16).hex(), os.urandom(8).hex()
+
+    response = await make_get_request(
+        f'/api/v1/films/{film["id"]}',
+        headers={'traceparent': f'00-{trace_id}-{parent_id}-01'})
+
+    assert response['status'] == HTTPStatus.OK
+    assert response['headers']['X-Trace-Id'] == trace_id
+    version, response_trace_id, span_id, flags = (
+        response['headers']['traceparent'].split('-'))
+    assert (version, response_trace_id, flags) == ('00', trace_id, '01')
+    assert len(span_id) == 16 and span_id != parent_id
+
+
+async def test_request_without_traceparent_is_not_traced(make_get_request):
+    response = await make_get_request('/api/v1/genres')
+
+    assert response['status'] == HTTPStatus.OK
+    assert 'X-Trace-Id' not in response['headers']
+    assert 'traceparent' not in response['headers']
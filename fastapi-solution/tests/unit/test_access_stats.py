@@ -0,0 +1,31 @@
+import pytest
+from fakeredis import aioredis
+
+from db.access_stats import STATS_PREFIX, AccessStats
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_top_members_after_flush():
+    redis = aioredis.FakeRedis()
+    stats = AccessStats()
+    for member, count in [('a', 1), ('b', 3), ('c', 2)]:
+        for _ in range(count):
+            stats.record('film_details', member)
+
+    assert await stats.top(redis, 'film_details', 2) == []
+    await stats.flush(redis)
+
+    assert await stats.top(redis, 'film_details', 2) == ['b', 'c']
+
+
+async def test_decay_keeps_largest_counters():
+    redis = aioredis.FakeRedis()
+    stats = AccessStats()
+    key = f'{STATS_PREFIX}:film_details'
+    await redis.zadd(key, {'a': 10, 'b': 20, 'c': 30})
+
+    await stats.decay(redis, ['film_details'], 0.5, 2)
+
+    assert await redis.zrevrange(key, 0, -1, withscores=True) == [
+        (b'c', 15), (b'b', 10)]
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+
+from core.settings import settings
+from services import auth
+from services.auth import AuthService, TokenVerifier
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+KEY, OTHER_KEY = make_key(), make_key()
+
+
+def make_token(key=KEY, kid='main', **claims) -> str:
+    claims = {'exp': int(time.time()) + 60, 'roles': ['subscriber'],
+              **claims}
+    return jwt.encode({k: v for k, v in claims.items() if v is not None},
+                      key, algorithm='RS256', headers={'kid': kid})
+
+
+@pytest.fixture
+def jwks_file(tmp_path):
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(KEY.public_key())
+    path = tmp_path / 'jwks.json'
+    path.write_text(f'{{"keys": [{jwk[:-1]}, "kid": "main"}}]}}')
+    return str(path)
+
+
+@pytest.fixture
+async def verifier(jwks_file):
+    verifier = TokenVerifier(httpx.AsyncClient(), jwks_file=jwks_file)
+    await verifier.load_keys()
+    return verifier
+
+
+@pytest.fixture
+def claims_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'auth_jwt_issuer', 'https://auth')
+    monkeypatch.setattr(settings, 'auth_jwt_audience', 'movies')
+    return {'iss': 'https://auth', 'aud': 'movies'}
+
+
+async def test_verify_valid_token(verifier):
+    assert verifier.verify(make_token(), ['subscriber']) == (
+        status.HTTP_204_NO_CONTENT, '')
+
+
+@pytest.mark.parametrize(
+    'token, expected',
+    [
+        (make_token(exp=int(time.time()) - 60),
+         (status.HTTP_401_UNAUTHORIZED, 'Token expired')),
+        (make_token(key=OTHER_KEY),
+         (status.HTTP_401_UNAUTHORIZED, 'Invalid token')),
+        # Решение о роли и о токене без срока остаётся сервису.
+        (make_token(roles=['admin']), None),
+        (make_token(exp=None), None),
+        ('not a token', None),
+    ]
+)
+async def test_verify_rejected_or_undecided(verifier, token, expected):
+    assert verifier.verify(token, ['subscriber']) == expected
+
+
+async def test_verify_issuer_and_audience(verifier, claims_settings):
+    assert verifier.verify(make_token(**claims_settings), None) == (
+        status.HTTP_204_NO_CONTENT, '')
+    for claims in [{**claims_settings, 'iss': 'https://other'},
+                   {**claims_settings, 'aud': 'other'},
+                   {**claims_settings, 'iss': None},
+                   {**claims_settings, 'aud': None}]:
+        assert verifier.verify(make_token(**claims), None) == (
+            status.HTTP_401_UNAUTHORIZED, 'Invalid token')
+
+
+async def test_unknown_kid_refresh_is_rate_limited(verifier, monkeypatch):
+    loads = 0
+    load_keys = verifier.load_keys
+
+    async def counted_load_keys():
+        nonlocal loads
+        loads += 1
+        await load_keys()
+
+    monkeypatch.setattr(verifier, 'load_keys', counted_load_keys)
+    token = make_token(kid='new')
+
+    # Ключи только что загружены: повторно их не перечитываем.
+    assert verifier.verify(token, None) is None
+    await asyncio.sleep(0)
+    assert loads == 0
+
+    verifier._loaded_at -= auth.JWKS_MIN_REFRESH_SECONDS
+    assert verifier.verify(token, None) is None
+    assert verifier.verify(token, None) is None
+    await asyncio.sleep(0)
+    assert loads == 1
+
+    assert verifier.verify(token, None) is None
+    await asyncio.sleep(0)
+    assert loads == 1
+
+
+class FakeAuthService:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.requests = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        if self.status_code == status.HTTP_204_NO_CONTENT:
+            return httpx.Response(self.status_code)
+        return httpx.Response(self.status_code, json={'detail': 'Denied'})
+
+
+@pytest.fixture
+def auth_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'auth_url', 'http://auth')
+
+
+def make_service(fake: FakeAuthService) -> AuthService:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    return AuthService(client)
+
+
+CREDS = HTTPAuthorizationCredentials(scheme='Bearer', credentials='token')
+
+
+async def test_concurrent_checks_make_one_request(auth_settings):
+    fake = FakeAuthService(status.HTTP_204_NO_CONTENT)
+    service = make_service(fake)
+
+    await asyncio.gather(*(service.check_access(CREDS, ['subscriber'])
+                           for _ in range(5)))
+    assert fake.requests == 1
+
+    await service.check_access(CREDS, ['subscriber'])
+    assert fake.requests == 1
+    await service.check_access(CREDS, ['admin'])
+    assert fake.requests == 2
+
+
+async def test_denied_decision_is_cached_briefly(auth_settings, monkeypatch):
+    monkeypatch.setattr(settings, 'auth_cache_deny_seconds', 1)
+    fake = FakeAuthService(status.HTTP_403_FORBIDDEN)
+    service = make_service(fake)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            await service.check_access(CREDS)
+        assert error.value.status_code == status.HTTP_403_FORBIDDEN
+    assert fake.requests == 1
+
+    await asyncio.sleep(1.1)
+    with pytest.raises(HTTPException):
+        await service.check_access(CREDS)
+    assert fake.requests == 2
+
+
+async def test_auth_service_errors_are_not_cached(auth_settings):
+    fake = FakeAuthService(status.HTTP_500_INTERNAL_SERVER_ERROR)
+    service = make_service(fake)
+
+    with pytest.raises(HTTPException) as error:
+        await service.check_access(CREDS)
+    assert error.value.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    failed_requests = fake.requests
+
+    fake.status_code = status.HTTP_204_NO_CONTENT
+    await service.check_access(CREDS)
+    assert fake.requests == failed_requests + 1
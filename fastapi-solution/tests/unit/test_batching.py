@@ -0,0 +1,113 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from db.search_engine.batching import BatchingSearchEngine
+from db.search_engine.slow_log import caller
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeSearchEngine:
+    def __init__(self, docs: dict[str, dict], error: Exception = None):
+        self.docs = docs
+        self.error = error
+        self.calls = []
+        self.callers = []
+
+    async def get_many(self, index, ids, fields):
+        self.calls.append((index, list(ids), fields))
+        self.callers.append(caller())
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        return [self.docs.get(str(id)) for id in ids]
+
+
+async def test_concurrent_get_by_id_use_one_get_many():
+    ids = [str(uuid4()) for _ in range(3)]
+    engine = FakeSearchEngine({id: {'id': id} for id in ids})
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=100)
+
+    docs = await asyncio.gather(
+        *(batching.get_by_id('movies', id, ['id']) for id in ids),
+        batching.get_by_id('movies', ids[0], ['id']))
+
+    assert docs == [{'id': id} for id in [*ids, ids[0]]]
+    assert engine.calls == [('movies', ids, ['id'])]
+
+
+async def test_batches_split_by_index_fields_and_size():
+    ids = [str(uuid4()) for _ in range(3)]
+    engine = FakeSearchEngine({id: {'id': id} for id in ids})
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=2)
+
+    await asyncio.gather(
+        *(batching.get_by_id('movies', id, ['id']) for id in ids),
+        batching.get_by_id('persons', ids[0], ['id']),
+        batching.get_by_id('movies', ids[0], ['title']))
+
+    assert sorted((index, len(ids), fields)
+                  for index, ids, fields in engine.calls) == [
+        ('movies', 1, ['id']), ('movies', 1, ['title']),
+        ('movies', 2, ['id']), ('persons', 1, ['id'])]
+
+
+async def test_missing_id_does_not_fail_batch():
+    found, missing = str(uuid4()), str(uuid4())
+    engine = FakeSearchEngine({found: {'id': found}})
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=100)
+
+    docs = await asyncio.gather(batching.get_by_id('movies', found, ['id']),
+                                batching.get_by_id('movies', missing, ['id']))
+
+    assert docs == [{'id': found}, None]
+    assert len(engine.calls) == 1
+
+
+async def test_cancelled_request_does_not_cancel_batch():
+    first, second = str(uuid4()), str(uuid4())
+    engine = FakeSearchEngine({first: {'id': first}, second: {'id': second}})
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=100)
+
+    cancelled = asyncio.create_task(batching.get_by_id('movies', first,
+                                                       ['id']))
+    waiting = asyncio.create_task(batching.get_by_id('movies', first, ['id']))
+    other = asyncio.create_task(batching.get_by_id('movies', second, ['id']))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    assert await waiting == {'id': first}
+    assert await other == {'id': second}
+    assert cancelled.cancelled()
+
+
+async def test_get_many_error_is_raised_for_every_request():
+    engine = FakeSearchEngine({}, error=ConnectionError('down'))
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=100)
+
+    results = await asyncio.gather(
+        *(batching.get_by_id('movies', str(uuid4()), ['id'])
+          for _ in range(2)),
+        return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert len(engine.calls) == 1
+
+
+async def test_batch_query_is_attributed_to_queueing_callers():
+    film_id = str(uuid4())
+    engine = FakeSearchEngine({film_id: {'id': film_id}})
+    batching = BatchingSearchEngine(engine, window=0.01, max_size=100)
+
+    async def film_details():
+        return await batching.get_by_id('movies', film_id, ['id'])
+
+    async def person_films():
+        return await batching.get_by_id('movies', film_id, ['id'])
+
+    await asyncio.gather(film_details(), person_films())
+
+    [source] = engine.callers
+    assert source == f'batch({__name__}.film_details, {__name__}.person_films)'
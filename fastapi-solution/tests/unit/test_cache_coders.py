@@ -0,0 +1,100 @@
+from uuid import uuid4
+
+import pytest
+from fastapi_cache.coder import JsonCoder
+from pydantic import ValidationError
+
+from models.film import ESFilmFull
+from utils import cache as cache_module
+from utils.cache import (COMPRESSED_PREFIX, MODEL_PREFIX,
+                         SCHEMA_VERSION_LENGTH, get_model_coder)
+
+
+def make_film(cast: int = 3) -> ESFilmFull:
+    return ESFilmFull(
+        id=uuid4(), title='Title', imdb_rating=7.5, description='Text',
+        genres=[{'id': uuid4(), 'name': 'Drama'}],
+        actors=[{'id': uuid4(), 'name': f'Actor {n}'} for n in range(cast)],
+        writers=[], directors=[{'id': uuid4(), 'name': 'Director'}])
+
+
+def test_trusted_entry_is_decoded_equal_to_model():
+    film = make_film()
+    coder = get_model_coder(ESFilmFull)
+
+    decoded = coder.decode(coder.encode(film))
+
+    assert decoded == film
+    assert decoded.actors[0].id == film.actors[0].id
+
+
+def test_trusted_entry_is_not_validated():
+    coder = get_model_coder(ESFilmFull)
+    header = coder.encode(make_film())[
+        :len(MODEL_PREFIX) + SCHEMA_VERSION_LENGTH]
+
+    decoded = coder.decode(header + b'{"title": 1}')
+
+    assert decoded.title == 1
+
+
+@pytest.mark.parametrize('header', [
+    b'', MODEL_PREFIX + b'0' * SCHEMA_VERSION_LENGTH])
+def test_entry_of_other_schema_is_validated(header):
+    film = make_film()
+    coder = get_model_coder(ESFilmFull)
+
+    assert coder.decode(header + film.json().encode()) == film
+    with pytest.raises(ValidationError):
+        coder.decode(header + b'{"title": "Title"}')
+
+
+def test_untrusted_entry_is_validated():
+    coder = get_model_coder(ESFilmFull, trusted=False)
+    header = coder.encode(make_film())[
+        :len(MODEL_PREFIX) + SCHEMA_VERSION_LENGTH]
+
+    with pytest.raises(ValidationError):
+        coder.decode(header + b'{"title": "Title"}')
+
+
+def test_large_entry_is_compressed():
+    film = make_film(cast=40)
+    coder = get_model_coder(ESFilmFull)
+
+    value = cache_module._encode(coder, film)
+
+    assert value.startswith(COMPRESSED_PREFIX)
+    assert len(value) < len(coder.encode(film))
+    assert cache_module._decode(coder, value) == film
+
+
+def test_small_entry_is_stored_as_is():
+    film = make_film(cast=0)
+    coder = get_model_coder(ESFilmFull)
+
+    value = cache_module._encode(coder, film)
+
+    assert value == coder.encode(film)
+    assert cache_module._decode(coder, value) == film
+
+
+def test_uncompressed_entries_are_read():
+    film = make_film(cast=40)
+    coder = get_model_coder(ESFilmFull)
+
+    # Значения, записанные до сжатия, без префикса.
+    assert cache_module._decode(coder, coder.encode(film)) == film
+    assert cache_module._decode(coder, film.json().encode()) == film
+
+
+def test_response_entry_is_compressed():
+    body = b'[' + b','.join(b'{"title": "Title"}' for _ in range(100)) + b']'
+    response = cache_module._body_response(body)
+
+    value = cache_module._encode(JsonCoder, response)
+    decoded = cache_module._decode(JsonCoder, value)
+
+    assert value.startswith(COMPRESSED_PREFIX)
+    assert decoded.body == body
+    assert decoded.headers['ETag'] == response.headers['ETag']
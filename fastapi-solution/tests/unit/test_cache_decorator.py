@@ -0,0 +1,158 @@
+import asyncio
+from uuid import uuid4
+
+import httpx
+import pytest
+from fakeredis import aioredis
+from fastapi import FastAPI, Response
+from fastapi_cache import FastAPICache
+
+from api.v1.films import FILM_FIELDS
+from db.cache import LocalCache, TieredRedisBackend
+from utils import cache as cache_module
+from utils.cache import (StaleResponseMiddleware, cache, invalidate,
+                         request_key_builder)
+from utils.resilience import Dependency, DependencyUnavailableError
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def backend():
+    backend = TieredRedisBackend(
+        aioredis.FakeRedis(), LocalCache(max_items=0, max_bytes=0, ttl=0),
+        Dependency('redis', lambda error: False))
+    FastAPICache.init(backend, prefix='test',
+                      key_builder=request_key_builder)
+    yield backend
+    FastAPICache.reset()
+    cache_module._refresh_attempts.clear()
+
+
+async def test_sparse_response_is_tagged_with_source_ids(backend):
+    film_id = str(uuid4())
+    app = FastAPI()
+
+    @app.get('/films')
+    @cache(expire=60, namespace='films')
+    async def films(fields: FILM_FIELDS.param = None,
+                    response: Response = None) -> Response:
+        assert 'id' in FILM_FIELDS.source(fields)
+        return FILM_FIELDS.response([{'id': film_id, 'title': 'Title'}],
+                                    fields, response)
+
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.get('/films', params={'fields': 'title'})
+    assert response.json() == [{'title': 'Title'}]
+    assert len(await backend.redis.keys('test:films:*')) == 1
+
+    assert await invalidate([film_id]) == 1
+    assert await backend.redis.keys('test:films:*') == []
+
+
+def stale_app(handler) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(StaleResponseMiddleware)
+    app.get('/films')(
+        cache(expire=60, namespace='films', stale=10, grace=30)(handler))
+    return app
+
+
+async def test_stale_state_reaches_every_waiter(backend):
+    calls = 0
+    release = asyncio.Event()
+
+    async def films() -> dict:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        # Ответ собран из просроченной записи.
+        cache_module._mark_stale()
+        return {'title': 'Title'}
+
+    app = stale_app(films)
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        requests = [asyncio.create_task(client.get('/films'))
+                    for _ in range(3)]
+        await asyncio.sleep(0.1)
+        release.set()
+        responses = await asyncio.gather(*requests)
+
+    assert calls == 1
+    for response in responses:
+        assert response.json() == {'title': 'Title'}
+        assert response.headers['X-Cache'] == 'STALE'
+        assert response.headers['Cache-Control'] == 'max-age=0'
+    assert await backend.redis.keys('test:films:*') == []
+
+
+async def test_grace_entry_is_served_when_dependency_is_down(backend):
+    available = True
+
+    async def films() -> dict:
+        if not available:
+            raise DependencyUnavailableError('elastic')
+        return {'title': 'Title'}
+
+    app = stale_app(films)
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.get('/films')
+        assert 'X-Cache' not in response.headers
+        [key] = await backend.redis.keys('test:films:*')
+        assert await backend.redis.ttl(key) == 100
+
+        await backend.redis.expire(key, 20)
+        available = False
+        response = await client.get('/films')
+
+    assert response.status_code == 200
+    assert response.json() == {'title': 'Title'}
+    assert response.headers['X-Cache'] == 'STALE'
+    assert response.headers['Cache-Control'] == 'max-age=0'
+
+
+async def test_stale_entry_is_refreshed_in_background(backend):
+    titles = iter(['Old', 'New'])
+
+    async def films() -> dict:
+        return {'title': next(titles)}
+
+    app = stale_app(films)
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        await client.get('/films')
+        [key] = await backend.redis.keys('test:films:*')
+        await backend.redis.expire(key, 35)
+
+        response = await client.get('/films')
+        assert response.json() == {'title': 'Old'}
+        assert 'X-Cache' not in response.headers
+        assert response.headers['Cache-Control'] == 'max-age=0'
+
+        await asyncio.gather(*cache_module._refresh_tasks)
+        assert await backend.redis.ttl(key) == 100
+        response = await client.get('/films')
+        assert response.json() == {'title': 'New'}
+
+
+async def test_stale_entry_locked_by_other_worker_is_not_refreshed(backend):
+    calls = 0
+
+    async def films() -> dict:
+        nonlocal calls
+        calls += 1
+        return {'title': 'Title'}
+
+    app = stale_app(films)
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        await client.get('/films')
+        [key] = await backend.redis.keys('test:films:*')
+        await backend.redis.expire(key, 35)
+        # Обновление уже ведёт другой worker.
+        assert await backend.acquire_lock(key.decode(), 10)
+
+        response = await client.get('/films')
+        await asyncio.gather(*cache_module._refresh_tasks)
+
+    assert response.json() == {'title': 'Title'}
+    assert calls == 1
+    assert await backend.redis.ttl(key) == 35
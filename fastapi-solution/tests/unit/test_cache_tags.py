@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeServer, aioredis
+
+from db.cache import LocalCache, TieredRedisBackend
+from utils.resilience import Dependency
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def backend():
+    redis = aioredis.FakeRedis()
+    return TieredRedisBackend(
+        redis, LocalCache(max_items=0, max_bytes=0, ttl=0),
+        Dependency('redis', lambda error: False))
+
+
+async def test_tag_ttl_is_only_extended(backend):
+    await backend.add_tags('key:long', ['tag'], 300)
+    await backend.add_tags('key:short', ['tag'], 10)
+
+    assert 290 < await backend.redis.ttl('tag') <= 300
+
+    await backend.add_tags('key:longer', ['tag'], 600)
+    assert 590 < await backend.redis.ttl('tag') <= 600
+
+
+async def test_tag_without_expire_is_persistent(backend):
+    await backend.add_tags('key:short', ['tag'], 10)
+    await backend.add_tags('key:forever', ['tag'])
+
+    assert await backend.redis.ttl('tag') == -1
+
+
+async def test_invalidate_tags_deletes_members(backend):
+    await backend.set('key:1', b'1', 10)
+    await backend.set('key:2', b'2', 300)
+    await backend.add_tags('key:1', ['tag'], 10)
+    await backend.add_tags('key:2', ['tag'], 300)
+
+    assert await backend.invalidate_tags(['tag']) == 2
+    assert await backend.redis.exists('key:1', 'key:2', 'tag') == 0
+
+
+async def test_invalidation_drops_local_entries_of_other_workers():
+    server = FakeServer()
+    workers = [
+        TieredRedisBackend(
+            aioredis.FakeRedis(server=server),
+            LocalCache(max_items=100, max_bytes=10000, ttl=60),
+            Dependency('redis', lambda error: False))
+        for _ in range(2)]
+    sender, receiver = workers
+    invalidated = []
+
+    async def listener(tag_keys):
+        invalidated.append(tag_keys)
+
+    receiver.add_invalidation_listener(listener)
+    await sender.set('key', b'value', 300)
+    await sender.add_tags('key', ['tag'], 300)
+    for worker in workers:
+        ttl, value = await worker.get_with_ttl('key')
+        assert value == b'value'
+        assert worker.local_cache.get('key') is not None
+
+    listening = asyncio.create_task(receiver.listen_invalidations())
+    try:
+        # Подписка оформляется в задаче, до неё сообщения теряются.
+        await asyncio.sleep(0.1)
+        assert await sender.invalidate_tags(['tag']) == 1
+        assert sender.local_cache.get('key') is None
+        for _ in range(50):
+            if invalidated:
+                break
+            await asyncio.sleep(0.1)
+    finally:
+        listening.cancel()
+
+    assert receiver.local_cache.get('key') is None
+    assert invalidated == [['tag']]
@@ -0,0 +1,69 @@
+from uuid import uuid4
+
+import pytest
+
+from services.genre import GenreService
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeSearchEngine:
+    def __init__(self, genres: list[dict]):
+        self.genres = genres
+        self.loads = 0
+        self.lookups = []
+
+    async def get_list_after(self, index, fields, cursor=None):
+        self.loads += 1
+        return list(self.genres), None
+
+    async def get_many(self, index, ids, fields):
+        self.lookups.append(list(ids))
+        by_id = {genre['id']: genre for genre in self.genres}
+        return [by_id.get(id) for id in ids]
+
+
+def tag(id: str) -> str:
+    return f'fastapi-cache:tag:{id}'
+
+
+@pytest.fixture
+async def service():
+    engine = FakeSearchEngine([{'id': str(uuid4()), 'name': 'Comedy'}])
+    service = GenreService(engine)
+    await service.refresh()
+    return service
+
+
+async def test_film_invalidation_keeps_snapshot(service):
+    film_id = str(uuid4())
+
+    await service.on_cache_invalidation([tag(film_id)])
+
+    assert service.search_engine.loads == 1
+    assert service.search_engine.lookups == [[film_id]]
+
+
+async def test_known_genre_invalidation_reloads_without_lookup(service):
+    genre_id = service.search_engine.genres[0]['id']
+
+    await service.on_cache_invalidation([tag(str(uuid4())), tag(genre_id)])
+
+    assert service.search_engine.loads == 2
+    assert service.search_engine.lookups == []
+
+
+async def test_new_genre_invalidation_reloads(service):
+    genre = {'id': str(uuid4()), 'name': 'Drama'}
+    service.search_engine.genres.append(genre)
+
+    await service.on_cache_invalidation([tag(genre['id'])])
+
+    assert service.search_engine.loads == 2
+    assert await service.get_by_id(genre['id']) is not None
+
+
+async def test_full_invalidation_reloads(service):
+    await service.on_cache_invalidation([])
+
+    assert service.search_engine.loads == 2
@@ -0,0 +1,59 @@
+from prometheus_client import REGISTRY
+
+from db.cache import LocalCache
+
+
+def requests(namespace: str, result: str) -> float:
+    return REGISTRY.get_sample_value(
+        'local_cache_requests_total',
+        {'namespace': namespace, 'result': result}) or 0
+
+
+def test_local_cache_hit_and_miss_metrics():
+    cache = LocalCache(max_items=10, max_bytes=1000, ttl=60)
+    hits, misses = requests('films', 'hit'), requests('films', 'miss')
+
+    assert cache.get('fastapi-cache:films:1') is None
+    cache.set('fastapi-cache:films:1', b'film', 30)
+    ttl, value = cache.get('fastapi-cache:films:1')
+
+    assert value == b'film'
+    assert 29 <= ttl <= 30
+    assert requests('films', 'hit') == hits + 1
+    assert requests('films', 'miss') == misses + 1
+
+
+def test_local_cache_size_metrics():
+    cache = LocalCache(max_items=10, max_bytes=1000, ttl=60)
+    items = REGISTRY.get_sample_value('local_cache_items')
+    size = REGISTRY.get_sample_value('local_cache_bytes')
+
+    cache.set('a:films:1', b'12345', None)
+    assert REGISTRY.get_sample_value('local_cache_items') == items + 1
+    assert REGISTRY.get_sample_value('local_cache_bytes') == size + 14
+
+    cache.clear()
+    assert REGISTRY.get_sample_value('local_cache_items') == items
+    assert REGISTRY.get_sample_value('local_cache_bytes') == size
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_items=2, max_bytes=1000, ttl=60)
+    cache.set('a:films:1', b'1', None)
+    cache.set('a:films:2', b'2', None)
+    cache.get('a:films:1')
+    cache.set('a:films:3', b'3', None)
+
+    assert cache.get('a:films:2') is None
+    assert cache.get('a:films:1') is not None
+    assert cache.get('a:films:3') is not None
+
+
+def test_local_cache_limits_bytes_and_namespace_ttl():
+    cache = LocalCache(max_items=10, max_bytes=20, ttl=60,
+                       namespace_ttl={'genres': 0})
+    cache.set('a:films:1', b'x' * 100, None)
+    cache.set('a:genres:1', b'x', None)
+
+    assert len(cache) == 0
+    assert cache.size == 0
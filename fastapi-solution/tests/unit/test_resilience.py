@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from utils import resilience
+from utils.resilience import (CircuitBreaker, CircuitOpenError, Dependency,
+                              DependencyUnavailableError, RetryBudget,
+                              backoff_delay)
+
+
+def test_backoff_delay_grows_exponentially_up_to_cap(monkeypatch):
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+
+    assert [backoff_delay(attempt, 0.05, 1) for attempt in range(7)] == [
+        0.05, 0.1, 0.2, 0.4, 0.8, 1, 1]
+
+
+def test_backoff_delay_is_jittered():
+    delays = {backoff_delay(3, 0.05, 1) for _ in range(100)}
+
+    assert all(0 <= delay <= 0.4 for delay in delays)
+    assert len(delays) > 1
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert 9 < error.value.retry_after <= 10
+
+
+@pytest.mark.asyncio
+async def test_breaker_lets_one_probe_through_after_timeout():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+
+    assert breaker.before_call() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # Неудачная проба снова размыкает предохранитель.
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    await asyncio.sleep(0.06)
+    assert breaker.before_call() is True
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+
+@pytest.mark.asyncio
+async def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+
+    assert breaker.before_call() is True
+    breaker.release_probe()
+    assert breaker.before_call() is True
+
+
+def test_retry_budget_is_spent():
+    budget = RetryBudget(2)
+
+    assert [budget.take() for _ in range(3)] == [True, True, False]
+
+
+class FlakyCall:
+    def __init__(self, errors: list[Exception]):
+        self.errors = errors
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'result'
+
+
+def is_failure(error: BaseException) -> bool:
+    return isinstance(error, ConnectionError)
+
+
+@pytest.mark.asyncio
+async def test_dependency_retries_failures():
+    dependency = Dependency('test', is_failure, max_attempts=3)
+    call = FlakyCall([ConnectionError(), ConnectionError()])
+
+    assert await dependency.call(call) == 'result'
+    assert call.calls == 3
+    assert dependency.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_dependency_gives_up_after_max_attempts():
+    dependency = Dependency('test', is_failure, max_attempts=2)
+    call = FlakyCall([ConnectionError()] * 3)
+
+    with pytest.raises(DependencyUnavailableError):
+        await dependency.call(call)
+    assert call.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_dependency_does_not_retry_rejected_requests():
+    dependency = Dependency('test', is_failure, max_attempts=3)
+    call = FlakyCall([ValueError()])
+
+    with pytest.raises(ValueError):
+        await dependency.call(call)
+    assert call.calls == 1
+    assert dependency.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_retries_are_limited_by_request_budget():
+    dependency = Dependency('test', is_failure, max_attempts=3)
+    resilience._retry_budget.set(RetryBudget(1))
+    first, second = (FlakyCall([ConnectionError()] * 3) for _ in range(2))
+
+    with pytest.raises(DependencyUnavailableError):
+        await dependency.call(first)
+    with pytest.raises(DependencyUnavailableError):
+        await dependency.call(second)
+
+    assert (first.calls, second.calls) == (2, 1)
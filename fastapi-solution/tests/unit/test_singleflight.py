@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    calls = []
+
+    def loader(key):
+        async def load():
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key
+        return load
+
+    results = await asyncio.gather(
+        *(single_flight.do('key', loader('key')) for _ in range(5)),
+        single_flight.do('other', loader('other')))
+
+    assert results == ['key'] * 5 + ['other']
+    assert calls == ['key', 'other']
+    assert len(single_flight) == 0
+
+
+async def test_error_is_raised_for_every_caller_and_not_kept():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ConnectionError('down')
+
+    results = await asyncio.gather(
+        *(single_flight.do('key', fail) for _ in range(2)),
+        return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+    async def load():
+        return 'value'
+
+    assert await single_flight.do('key', load) == 'value'
+
+
+async def test_cancelled_caller_does_not_cancel_call():
+    single_flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return 'value'
+
+    cancelled = asyncio.create_task(single_flight.do('key', load))
+    waiting = asyncio.create_task(single_flight.do('key', load))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+
+    assert await waiting == 'value'
+    assert cancelled.cancelled()
@@ -0,0 +1,91 @@
+import pytest
+
+from db.search_engine import slow_log
+from db.search_engine.slow_log import SlowQueryLog, fingerprint, normalize
+
+
+def search_body(title: str, ids: list[str]) -> dict:
+    return {'query': {'bool': {
+        'must': [{'match': {'title': title}}],
+        'filter': [{'terms': {'genres.id': ids}}],
+    }}, 'size': 50, 'from': 0}
+
+
+def test_normalize_strips_literals():
+    assert normalize(search_body('Matrix', ['a', 'b', 'c'])) == {
+        'query': {'bool': {
+            'must': [{'match': {'title': '?'}}],
+            'filter': [{'terms': {'genres.id': ['?']}}],
+        }}, 'size': '?', 'from': '?'}
+
+
+def test_same_shape_has_same_fingerprint():
+    key, shape = fingerprint('search', search_body('Matrix', ['a']))
+    other_key, other_shape = fingerprint(
+        'search', search_body('Star Wars', ['b', 'c', 'd']))
+
+    assert (key, shape) == (other_key, other_shape)
+    assert 'Matrix' not in shape
+
+
+def test_different_shape_has_different_fingerprint():
+    body = search_body('Matrix', ['a'])
+    key, _ = fingerprint('search', body)
+    del body['query']['bool']['filter']
+
+    assert fingerprint('search', body)[0] != key
+    assert fingerprint('count', search_body('Matrix', ['a']))[0] != key
+
+
+@pytest.mark.parametrize('threshold, duration, took, expected', [
+    (100, 150, None, True),
+    (100, 50, 120, True),
+    (100, 50, 20, False),
+    (0, 1000, 1000, False),
+])
+def test_is_slow(threshold, duration, took, expected):
+    assert SlowQueryLog(threshold).is_slow(duration, took) is expected
+
+
+def test_top_is_ordered_by_total_time():
+    log = SlowQueryLog(100)
+    bodies = [{'query': {'match_all': {}}}, {'query': {'ids': {}}}]
+    log.record('search', 'movies', bodies[0], None, 300, 250, 'a')
+    log.record('search', 'movies', bodies[1], None, 200, 150, 'b')
+    log.record('search', 'movies', bodies[1], None, 200, None, 'c')
+
+    top = log.top(2)
+
+    assert [(stats.count, stats.total_ms, stats.max_ms) for stats in top] == [
+        (2, 400, 200), (1, 300, 300)]
+    assert top[0].callers == {'b', 'c'}
+    assert top[0].total_took_ms == 150
+    assert len(log.top(1)) == 1
+
+
+def test_new_fingerprints_are_dropped_over_limit(monkeypatch):
+    monkeypatch.setattr(slow_log, 'MAX_FINGERPRINTS', 2)
+    log = SlowQueryLog(100)
+    bodies = [{'query': {kind: {}}} for kind in ('a', 'b', 'c')]
+    for body in bodies:
+        log.record('search', 'movies', body, None, 200, None, 'caller')
+    # Уже известные отпечатки по-прежнему учитываются.
+    log.record('search', 'movies', bodies[0], None, 200, None, 'caller')
+
+    assert log.dropped == 1
+    assert sorted(stats.count for stats in log.top(10)) == [1, 2]
+
+    log.clear()
+    assert (log.top(10), log.dropped) == ([], 0)
+
+
+def test_record_counts_hits_and_source_size():
+    log = SlowQueryLog(100)
+    result = {'hits': {'hits': [{'_source': {'id': 'a'}},
+                                {'_source': {'id': 'bc'}}]}}
+
+    log.record('search', 'movies', {}, result, 200, None, 'caller')
+
+    [stats] = log.top(1)
+    assert stats.total_hits == 2
+    assert stats.total_source_bytes == len('{"id":"a"}{"id":"bc"}')
@@ -0,0 +1,95 @@
+import httpx
+import orjson
+import pytest
+from fastapi import FastAPI
+
+from utils import tracing
+from utils.tracing import SpanExporter, TracingMiddleware, span
+
+pytestmark = pytest.mark.asyncio
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get('/films/{film_id}')
+    async def film(film_id: str) -> dict:
+        with span('search_engine.get', index='movies'):
+            pass
+        return {'id': film_id}
+
+    yield app
+    tracing._finished.clear()
+
+
+@pytest.mark.parametrize('header, expected', [
+    (f'00-{TRACE_ID}-{PARENT_ID}-01', (TRACE_ID, PARENT_ID, True)),
+    (f'00-{TRACE_ID}-{PARENT_ID}-00', (TRACE_ID, PARENT_ID, False)),
+    (f'00-{"0" * 32}-{PARENT_ID}-01', None),
+    (f'00-{TRACE_ID}-{"0" * 16}-01', None),
+    (f'01-{TRACE_ID}-{PARENT_ID}-01', None),
+    ('', None),
+    (None, None),
+])
+async def test_parse_traceparent(header, expected):
+    assert tracing._parse_traceparent(header) == expected
+
+
+@pytest.mark.parametrize('ratio, expected', [
+    (0, [False, False, False]),
+    (0.5, [True, False, False]),
+    (1, [True, True, True]),
+])
+async def test_sampling_depends_on_trace_id(ratio, expected):
+    trace_ids = [f'{TRACE_ID[:16]}{low:016x}'
+                 for low in (0, 2 ** 63, 2 ** 64 - 1)]
+
+    assert [tracing._sampled(trace_id, ratio)
+            for trace_id in trace_ids] == expected
+
+
+async def test_traceparent_is_propagated(app):
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.get('/films/1', headers={
+            'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+
+    child, root = tracing._finished
+    assert response.headers['X-Trace-Id'] == TRACE_ID
+    assert response.headers['traceparent'] == (
+        f'00-{TRACE_ID}-{root.span_id}-01')
+    assert (root.trace_id, root.parent_id) == (TRACE_ID, PARENT_ID)
+    assert root.name == 'GET /films/{film_id}'
+    assert root.attributes['http.status_code'] == 200
+    assert (child.trace_id, child.parent_id) == (TRACE_ID, root.span_id)
+    assert child.attributes == {'index': 'movies'}
+
+
+async def test_unsampled_request_is_not_traced(app):
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        response = await client.get('/films/1', headers={
+            'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-00'})
+
+    assert 'X-Trace-Id' not in response.headers
+    assert tracing._finished == []
+
+
+async def test_spans_are_exported_to_file(app, tmp_path):
+    async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+        await client.get('/films/1', headers={
+            'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+    file = tmp_path / 'spans.jsonl'
+
+    async with httpx.AsyncClient() as http_client:
+        await SpanExporter(http_client, file=str(file)).export()
+
+    [line] = file.read_bytes().splitlines()
+    [resource_spans] = orjson.loads(line)['resourceSpans']
+    spans = resource_spans['scopeSpans'][0]['spans']
+    assert [exported['name'] for exported in spans] == [
+        'search_engine.get', 'GET /films/{film_id}']
+    assert tracing._finished == []
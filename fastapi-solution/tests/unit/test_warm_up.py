@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+import pytest
+
+from db.search_engine.elastic import KeepAliveConnection
+from main import warm_up
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_warm_up_holds_connections_at_once():
+    active = peak = 0
+
+    async def request():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    await warm_up('test', 5, request)
+
+    assert peak == 5
+
+
+async def test_warm_up_failures_are_logged(caplog):
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        if calls % 2:
+            raise ConnectionError('refused')
+
+    with caplog.at_level(logging.WARNING, logger='main'):
+        await warm_up('test', 3, request)
+
+    assert '2 of 3 test connections failed to warm up' in caplog.text
+
+
+async def test_elastic_connection_keeps_idle_sockets():
+    connection = KeepAliveConnection(host='127.0.0.1', port=9200, maxsize=7,
+                                     keepalive_timeout=42)
+    await connection._create_aiohttp_session()
+    try:
+        connector = connection.session.connector
+        assert connector.limit == 7
+        assert connector._keepalive_timeout == 42
+    finally:
+        await connection.close()